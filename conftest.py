@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+# Make the project modules importable from the test files, once per session
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Select the in-memory database before anything imports the database module,
+# so nothing test modules run at import time touches library.db on disk
+os.environ['TESTING'] = '1'
+
+from database import (
+    init_database, add_sample_data, get_db_connection,
+    invalidate_borrowed_books_cache, clear_isbn_cache, invalidate_all_books_cache
+)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _db():
+    """Create one in-memory database with sample data for the whole test session."""
+    init_database()
+    add_sample_data()
+
+    # Snapshot the initial state so each test can be reset to it
+    snapshot = sqlite3.connect(':memory:')
+    get_db_connection().backup(snapshot)
+    yield snapshot
+    snapshot.close()
+
+
+@pytest.fixture(scope='module')
+def conn():
+    """The worker's database connection, shared by a module's setup helpers."""
+    # Not closed here: it is the persistent per-thread connection the services use too
+    return get_db_connection()
+
+
+@pytest.fixture
+def insert_borrow(conn, now):
+    """
+    Record a loan directly with the given due date, bypassing borrow_book_by_patron.
+    Writes are left uncommitted so a setup can commit several loans at once.
+    """
+    def _insert_borrow(patron_id, book_id, due_date):
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+            VALUES (?, ?, ?, ?)
+        ''', (patron_id, book_id, now.isoformat(), due_date.isoformat()))
+        conn.execute('UPDATE books SET available_copies = available_copies - 1 WHERE id = ?', (book_id,))
+        invalidate_borrowed_books_cache(patron_id)
+        invalidate_all_books_cache()
+    return _insert_borrow
+
+
+@pytest.fixture
+def now():
+    """Current time, read once per test."""
+    return datetime.now()
+
+
+@pytest.fixture(autouse=True)
+def _restore_db(_db):
+    """
+    Reset the database to the session snapshot after each test.
+    The service layer commits its own writes, so SAVEPOINT rollback can't undo them;
+    copying the snapshot back with the SQLite backup API does.
+    """
+    yield
+    conn = get_db_connection()
+    # A test that failed mid-write can leave a transaction open, which would make the backup fail
+    conn.rollback()
+    _db.backup(conn)
+    invalidate_borrowed_books_cache()
+    clear_isbn_cache()
+    invalidate_all_books_cache()
@@ -3,21 +3,111 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import os
 import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
 # Database configuration
 DATABASE = 'library.db'
 
+# Test runs set TESTING=1; durability is irrelevant there, so commits skip fsync
+TESTING = os.environ.get('TESTING') == '1'
+_TEST_PRAGMAS = '''
+    PRAGMA journal_mode=MEMORY;
+    PRAGMA synchronous=OFF;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA locking_mode=EXCLUSIVE;
+'''
+
+# Shared-cache URI used when init_database(':memory:') is requested, so every
+# connection in the process sees the same in-memory database
+MEMORY_DATABASE = 'file:library_memdb?mode=memory&cache=shared'
+_memory_keeper: Optional[sqlite3.Connection] = None
+
+# Active-loan cache configuration (patron_id -> (expires_at, borrowed_books)); the generation
+# is bumped on every invalidation, like _all_books_generation below
+BORROWED_BOOKS_CACHE_TTL = 60
+BORROWED_BOOKS_CACHE_MAXSIZE = 4096
+_borrowed_books_cache: Dict[str, Tuple[float, List[Dict]]] = {}
+_borrowed_books_generation = 0
+_borrowed_books_cache_lock = threading.Lock()
+
+# ISBN existence cache used by duplicate checks (isbn -> exists)
+ISBN_CACHE_MAXSIZE = 65536
+_isbn_exists_cache: Dict[str, bool] = {}
+_isbn_exists_cache_lock = threading.Lock()
+
+# Full catalog cache (None until first read); dropped on any write to books.
+# The generation is bumped on every invalidation, so a read that overlapped a write
+# can tell its result may predate that write and must not be cached
+_all_books_cache: Optional[List[Dict]] = None
+_all_books_generation = 0
+_all_books_cache_lock = threading.Lock()
+
+# Whether the books_fts full-text index was set up by init_database
+_books_fts_enabled = False
+
+# Per-thread persistent connection
+_tls = threading.local()
+
+def _is_open(conn: sqlite3.Connection) -> bool:
+    """Check whether a connection has not been closed yet."""
+    try:
+        conn.in_transaction
+        return True
+    except sqlite3.ProgrammingError:
+        return False
+
 def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row  # This enables column access by name
+    """Get this thread's database connection, opening it on first use (or after it was closed)."""
+    conn = getattr(_tls, 'conn', None)
+    if conn is None or getattr(_tls, 'database', None) != DATABASE or not _is_open(conn):
+        conn = sqlite3.connect(DATABASE, uri=True, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row  # This enables column access by name
+        if TESTING:
+            conn.executescript(_TEST_PRAGMAS)
+        else:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        _tls.conn = conn
+        _tls.database = DATABASE
     return conn
 
-def init_database():
-    """Initialize the database with required tables."""
+def use_database(path: str):
+    """
+    Point the module at a different database file or URI.
+    ':memory:' selects a shared in-memory database that lives for the rest of the process.
+    """
+    global DATABASE, _memory_keeper
+    if path == ':memory:':
+        path = MEMORY_DATABASE
+    if path == DATABASE:
+        return
+
+    DATABASE = path
+    # Keep one connection open so an in-memory database survives callers closing theirs
+    if _memory_keeper is not None:
+        _memory_keeper.close()
+        _memory_keeper = None
+    if 'mode=memory' in path:
+        _memory_keeper = sqlite3.connect(path, uri=True, check_same_thread=False)
+
+    invalidate_borrowed_books_cache()
+    clear_isbn_cache()
+    invalidate_all_books_cache()
+
+def init_database(path: Optional[str] = None):
+    """
+    Initialize the database with required tables.
+    
+    Args:
+        path: Optional database file or URI to switch to first (':memory:' for an in-memory database)
+    """
+    if path is not None:
+        use_database(path)
     conn = get_db_connection()
     
     # Create books table
@@ -44,9 +134,67 @@ def init_database():
             FOREIGN KEY (book_id) REFERENCES books (id)
         )
     ''')
-    
+
+    # Create indexes for search and patron lookups
+    # (books.isbn is already indexed by its UNIQUE constraint;
+    # idx_books_title is in BINARY order so ORDER BY title reads it without a sort;
+    # '%term%' LIKE can't seek any index, so the old NOCASE ones are dropped from existing files)
+    conn.executescript('''
+        DROP INDEX IF EXISTS idx_books_title_nocase;
+        DROP INDEX IF EXISTS idx_books_author_nocase;
+        CREATE INDEX IF NOT EXISTS idx_books_title ON books (title);
+        CREATE INDEX IF NOT EXISTS idx_borrow_patron_date ON borrow_records (patron_id, borrow_date DESC);
+        CREATE INDEX IF NOT EXISTS idx_borrow_patron_book_open ON borrow_records (patron_id, book_id)
+            WHERE return_date IS NULL;
+    ''')
+
     conn.commit()
-    conn.close()
+
+    _init_books_fts(conn)
+
+    invalidate_borrowed_books_cache()
+    clear_isbn_cache()
+    invalidate_all_books_cache()
+
+def _init_books_fts(conn: sqlite3.Connection):
+    """
+    Create the books_fts trigram index over title/author, kept in sync by triggers.
+    Falls back to plain LIKE search if this SQLite build lacks FTS5 trigram support.
+    """
+    global _books_fts_enabled
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    ).fetchone()
+    try:
+        conn.executescript('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                title, author, content='books', content_rowid='id', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+                INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+            END;
+            CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+                INSERT INTO books_fts (books_fts, rowid, title, author)
+                VALUES ('delete', old.id, old.title, old.author);
+            END;
+            CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author ON books BEGIN
+                INSERT INTO books_fts (books_fts, rowid, title, author)
+                VALUES ('delete', old.id, old.title, old.author);
+                INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+            END;
+        ''')
+        if not exists:
+            # Index books that were added before the full-text table existed
+            conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+        conn.commit()
+        _books_fts_enabled = True
+    except sqlite3.OperationalError:
+        conn.rollback()
+        _books_fts_enabled = False
+
+def has_books_fts() -> bool:
+    """Check whether title/author searches can use the books_fts index."""
+    return _books_fts_enabled
 
 def add_sample_data():
     """Add sample data to the database if it's empty."""
@@ -61,11 +209,10 @@ def add_sample_data():
             ('1984', 'George Orwell', '9780451524935', 1)
         ]
         
-        for title, author, isbn, copies in sample_books:
-            conn.execute('''
-                INSERT INTO books (title, author, isbn, total_copies, available_copies)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (title, author, isbn, copies, copies))
+        conn.executemany('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(title, author, isbn, copies, copies) for title, author, isbn, copies in sample_books])
         
         # Make 1984 unavailable by adding a borrow record
         conn.execute('''
@@ -79,34 +226,104 @@ def add_sample_data():
         conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
         
         conn.commit()
-    
-    conn.close()
+        invalidate_all_books_cache()
 
 # Helper Functions for Database Operations
 
+def invalidate_all_books_cache():
+    """Drop the cached catalog so the next get_all_books() re-reads the table."""
+    global _all_books_cache, _all_books_generation
+    with _all_books_cache_lock:
+        _all_books_cache = None
+        _all_books_generation += 1
+
 def get_all_books() -> List[Dict]:
-    """Get all books from the database."""
-    conn = get_db_connection()
-    books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
-    conn.close()
-    return [dict(book) for book in books]
+    """
+    Get all books from the database (cached until the books table is next written).
+    Each call returns fresh dicts, so callers may modify them without touching the cache.
+    """
+    global _all_books_cache
+    with _all_books_cache_lock:
+        cached = _all_books_cache
+        generation = _all_books_generation
+    if cached is None:
+        conn = get_db_connection()
+        cached = [dict(book) for book in conn.execute('SELECT * FROM books ORDER BY title')]
+        with _all_books_cache_lock:
+            # Only cache the read if no write invalidated the catalog while it ran
+            if _all_books_generation == generation:
+                _all_books_cache = cached
+    return [dict(book) for book in cached]
 
 def get_book_by_id(book_id: int) -> Optional[Dict]:
     """Get a specific book by ID."""
     conn = get_db_connection()
     book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-    conn.close()
     return dict(book) if book else None
 
 def get_book_by_isbn(isbn: str) -> Optional[Dict]:
     """Get a specific book by ISBN."""
     conn = get_db_connection()
     book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-    conn.close()
     return dict(book) if book else None
 
+def clear_isbn_cache():
+    """Forget all cached ISBN existence results."""
+    with _isbn_exists_cache_lock:
+        _isbn_exists_cache.clear()
+
+def _remember_isbn(isbn: str, exists: bool):
+    """Record whether a book with this ISBN exists."""
+    with _isbn_exists_cache_lock:
+        if len(_isbn_exists_cache) >= ISBN_CACHE_MAXSIZE:
+            _isbn_exists_cache.clear()
+        _isbn_exists_cache[isbn] = exists
+
+def isbn_exists(isbn: str) -> bool:
+    """Check whether a book with this ISBN exists, using the ISBN cache when possible."""
+    with _isbn_exists_cache_lock:
+        cached = _isbn_exists_cache.get(isbn)
+    if cached is not None:
+        return cached
+    exists = get_book_by_isbn(isbn) is not None
+    _remember_isbn(isbn, exists)
+    return exists
+
+def invalidate_borrowed_books_cache(patron_id: Optional[str] = None):
+    """Drop cached active loans for a patron, or for all patrons if none is given."""
+    global _borrowed_books_generation
+    with _borrowed_books_cache_lock:
+        _borrowed_books_generation += 1
+        if patron_id is None:
+            _borrowed_books_cache.clear()
+        else:
+            _borrowed_books_cache.pop(patron_id, None)
+
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
-    """Get currently borrowed books for a patron."""
+    """
+    Get currently borrowed books for a patron (cached for BORROWED_BOOKS_CACHE_TTL seconds).
+    Each call returns fresh dicts with is_overdue evaluated against the current time.
+    """
+    now = time.monotonic()
+    with _borrowed_books_cache_lock:
+        cached = _borrowed_books_cache.get(patron_id)
+        generation = _borrowed_books_generation
+    if cached and cached[0] > now:
+        borrowed_books = cached[1]
+    else:
+        borrowed_books = _fetch_patron_borrowed_books(patron_id)
+        with _borrowed_books_cache_lock:
+            # Only cache the read if no borrow or return invalidated loans while it ran
+            if _borrowed_books_generation == generation:
+                if len(_borrowed_books_cache) >= BORROWED_BOOKS_CACHE_MAXSIZE:
+                    _borrowed_books_cache.clear()
+                _borrowed_books_cache[patron_id] = (now + BORROWED_BOOKS_CACHE_TTL, borrowed_books)
+
+    current_time = datetime.now()
+    return [{**loan, 'is_overdue': current_time > loan['due_date']} for loan in borrowed_books]
+
+def _fetch_patron_borrowed_books(patron_id: str) -> List[Dict]:
+    """Load currently borrowed books for a patron from the database."""
     conn = get_db_connection()
     records = conn.execute('''
         SELECT br.*, b.title, b.author 
@@ -115,7 +332,6 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
         WHERE br.patron_id = ? AND br.return_date IS NULL
         ORDER BY br.borrow_date
     ''', (patron_id,)).fetchall()
-    conn.close()
     
     borrowed_books = []
     for record in records:
@@ -125,7 +341,6 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
             'author': record['author'],
             'borrow_date': datetime.fromisoformat(record['borrow_date']),
             'due_date': datetime.fromisoformat(record['due_date']),
-            'is_overdue': datetime.now() > datetime.fromisoformat(record['due_date'])
         })
     
     return borrowed_books
@@ -137,9 +352,22 @@ def get_patron_borrow_count(patron_id: str) -> int:
         SELECT COUNT(*) as count FROM borrow_records 
         WHERE patron_id = ? AND return_date IS NULL
     ''', (patron_id,)).fetchone()['count']
-    conn.close()
     return count
 
+def get_patron_last_activity(patron_id: str, now: datetime) -> Tuple[int, Optional[str], Optional[str], int]:
+    """
+    Get (record count, latest borrow date, latest return date, overdue loan count) for a patron's
+    borrow records, counting open loans whose due date is before now as overdue.
+    """
+    conn = get_db_connection()
+    row = conn.execute('''
+        SELECT COUNT(*) as count, MAX(borrow_date) as last_borrow, MAX(return_date) as last_return,
+               COUNT(CASE WHEN return_date IS NULL AND due_date < ? THEN 1 END) as overdue
+        FROM borrow_records
+        WHERE patron_id = ?
+    ''', (now.isoformat(), patron_id)).fetchone()
+    return row['count'], row['last_borrow'], row['last_return'], row['overdue']
+
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
     """Insert a new book into the database."""
     conn = get_db_connection()
@@ -149,10 +377,17 @@ def insert_book(title: str, author: str, isbn: str, total_copies: int, available
             VALUES (?, ?, ?, ?, ?)
         ''', (title, author, isbn, total_copies, available_copies))
         conn.commit()
-        conn.close()
+        _remember_isbn(isbn, True)
+        invalidate_all_books_cache()
         return True
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        # Drop any stale "not found" entry so the next check re-reads the table
+        with _isbn_exists_cache_lock:
+            _isbn_exists_cache.pop(isbn, None)
+        return False
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False
 
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
@@ -164,10 +399,10 @@ def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, du
             VALUES (?, ?, ?, ?)
         ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
         conn.commit()
-        conn.close()
+        invalidate_borrowed_books_cache(patron_id)
         return True
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False
 
 def update_book_availability(book_id: int, change: int) -> bool:
@@ -178,10 +413,28 @@ def update_book_availability(book_id: int, change: int) -> bool:
             UPDATE books SET available_copies = available_copies + ? WHERE id = ?
         ''', (change, book_id))
         conn.commit()
-        conn.close()
+        invalidate_all_books_cache()
         return True
     except Exception as e:
-        conn.close()
+        conn.rollback()
+        return False
+
+def checkout_book_copy(book_id: int) -> bool:
+    """Take one available copy of a book; False if none were left."""
+    conn = get_db_connection()
+    try:
+        # Check and decrement in one statement so concurrent borrows can't overdraw copies
+        cursor = conn.execute('''
+            UPDATE books SET available_copies = available_copies - 1
+            WHERE id = ? AND available_copies > 0
+        ''', (book_id,))
+        conn.commit()
+        if cursor.rowcount != 1:
+            return False
+        invalidate_all_books_cache()
+        return True
+    except Exception as e:
+        conn.rollback()
         return False
 
 def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
@@ -194,8 +447,12 @@ def update_borrow_record_return_date(patron_id: str, book_id: int, return_date:
             WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
         ''', (return_date.isoformat(), patron_id, book_id))
         conn.commit()
-        conn.close()
+        invalidate_borrowed_books_cache(patron_id)
         return True
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False
+
+# Test runs use the shared in-memory database instead of library.db
+if TESTING:
+    use_database(':memory:')
@@ -1,12 +1,41 @@
-from flask import Blueprint, render_template, request
+import hashlib
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, make_response, session
+from database import get_patron_last_activity
 from services.library_service import get_patron_status_report
+from services.validation import valid_patron_id
 
 patron = Blueprint('patron', __name__)
 
+def _status_etag(patron_id):
+    """
+    Build an ETag for a patron's status page from their latest borrow activity.
+    Today's date is included because fees change daily, and the overdue count because
+    a loan turns overdue at its due time of day, not at midnight.
+    """
+    now = datetime.now()
+    count, last_borrow, last_return, overdue = get_patron_last_activity(patron_id, now)
+    key = f'{patron_id}|{count}|{last_borrow}|{last_return}|{overdue}|{now.date().isoformat()}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
 @patron.route('/patron/status')
 def status():
     patron_id = request.args.get('patron_id')
     if patron_id:
+        # Pending flash messages change the rendered page, so only revalidate without them
+        etag = None
+        if valid_patron_id(patron_id) and not session.get('_flashes'):
+            etag = _status_etag(patron_id)
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
         status = get_patron_status_report(patron_id)
-        return render_template('patron.html', patron_id=patron_id, status=status)
-    return render_template('patron.html')
\ No newline at end of file
+        response = make_response(render_template('patron.html', patron_id=patron_id, status=status))
+        if etag:
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
+    return render_template('patron.html')
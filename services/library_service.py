@@ -3,15 +3,55 @@ Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
 
+import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from .payment_service import PaymentGateway
+from .validation import valid_patron_id
 from database import (
-    get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
-    insert_book, insert_borrow_record, update_book_availability,
-    update_borrow_record_return_date, get_all_books, get_patron_borrowed_books, get_db_connection
+    get_book_by_id, isbn_exists, get_patron_borrow_count,
+    insert_book, insert_borrow_record, update_book_availability, checkout_book_copy,
+    update_borrow_record_return_date, get_all_books, get_patron_borrowed_books, get_db_connection,
+    has_books_fts
 )
 
+logger = logging.getLogger(__name__)
+
+def _isbn_ok(isbn) -> bool:
+    """Return True if isbn is exactly 13 ASCII digits."""
+    return isinstance(isbn, str) and len(isbn) == 13 and isbn.isascii() and isbn.isdigit()
+
+# Fixed SQL per search type so sqlite3's statement cache can reuse the parsed plan
+_SEARCH_SQL = {
+    # Exact match for ISBN
+    'isbn': 'SELECT * FROM books WHERE isbn = ? ORDER BY title',
+    # Partial match for title or author
+    'title': 'SELECT * FROM books WHERE title LIKE ? COLLATE NOCASE ORDER BY title',
+    'author': 'SELECT * FROM books WHERE author LIKE ? COLLATE NOCASE ORDER BY title',
+}
+
+# Partial title/author matches served by the books_fts trigram index (same LIKE semantics)
+_FTS_SEARCH_SQL = {
+    'title': 'SELECT b.* FROM books_fts f JOIN books b ON b.id = f.rowid WHERE f.title LIKE ? ORDER BY b.title',
+    'author': 'SELECT b.* FROM books_fts f JOIN books b ON b.id = f.rowid WHERE f.author LIKE ? ORDER BY b.title',
+}
+
+def _to_date(value):
+    """Normalize a datetime, date or ISO-8601 string to a date."""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).date()
+    return value.date() if isinstance(value, datetime) else value
+
+# Late fee by days overdue: $0.50/day for the first 7 days, $1.00/day after that,
+# capped at $15.00 (reached on day 19, so every later day uses the last entry)
+_FEE_TABLE = [round(min(15.00, 0.50 * min(d, 7) + 1.00 * max(d - 7, 0)), 2) for d in range(20)]
+
+def _fee(days_overdue: int) -> float:
+    """Late fee for a number of days overdue, looked up in _FEE_TABLE."""
+    if days_overdue <= 0:
+        return 0.00
+    return _FEE_TABLE[min(days_overdue, len(_FEE_TABLE) - 1)]
+
 def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
     """
     Add a new book to the catalog.
@@ -26,37 +66,47 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
     Returns:
         tuple: (success: bool, message: str)
     """
-    # Input validation
-    if not title or not title.strip():
+    # Input validation (cheapest checks first; bool is an int subclass, so reject it explicitly)
+    if not isinstance(total_copies, int) or isinstance(total_copies, bool) or total_copies <= 0:
+        return False, "Total copies must be a positive integer."
+    
+    if not _isbn_ok(isbn):
+        return False, "ISBN must be exactly 13 digits."
+    
+    title = title.strip() if title else ''
+    if not title:
         return False, "Title is required."
     
-    if len(title.strip()) > 200:
+    if len(title) > 200:
         return False, "Title must be less than 200 characters."
     
-    if not author or not author.strip():
+    author = author.strip() if author else ''
+    if not author:
         return False, "Author is required."
     
-    if len(author.strip()) > 100:
+    if len(author) > 100:
         return False, "Author must be less than 100 characters."
     
-    if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
-    
-    if not isinstance(total_copies, int) or total_copies <= 0:
-        return False, "Total copies must be a positive integer."
-    
     # Check for duplicate ISBN
-    existing = get_book_by_isbn(isbn)
-    if existing:
+    if isbn_exists(isbn):
         return False, "A book with this ISBN already exists."
     
     # Insert new book
-    success = insert_book(title.strip(), author.strip(), isbn, total_copies, total_copies)
+    success = insert_book(title, author, isbn, total_copies, total_copies)
     if success:
-        return True, f'Book "{title.strip()}" has been successfully added to the catalog.'
+        return True, f'Book "{title}" has been successfully added to the catalog.'
     else:
         return False, "Database error occurred while adding the book."
 
+def get_books_index_by_isbn() -> Dict[str, Dict]:
+    """
+    Get the catalog keyed by ISBN.
+    
+    Returns:
+        dict: Mapping of ISBN to book dictionary
+    """
+    return {book['isbn']: book for book in get_all_books()}
+
 def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
     Allow a patron to borrow a book.
@@ -70,7 +120,7 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
         tuple: (success: bool, message: str)
     """
     # Validate patron ID
-    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+    if not valid_patron_id(patron_id):
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
     # Check if book exists and is available
@@ -84,22 +134,22 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     # Check patron's current borrowed books count
     current_borrowed = get_patron_borrow_count(patron_id)
     
-    if current_borrowed > 5:
+    if current_borrowed >= 5:
         return False, "You have reached the maximum borrowing limit of 5 books."
     
     # Create borrow record
     borrow_date = datetime.now()
     due_date = borrow_date + timedelta(days=14)
     
-    # Insert borrow record and update availability
+    # Take a copy first; this fails if another borrow got the last one since the check above
+    if not checkout_book_copy(book_id):
+        return False, "This book is currently not available."
+    
     borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
     if not borrow_success:
+        update_book_availability(book_id, 1)
         return False, "Database error occurred while creating borrow record."
     
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
-    
     return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
 
 def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
@@ -115,7 +165,7 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
         tuple: (success: bool, message: str)
     """
     # Input validation
-    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+    if not valid_patron_id(patron_id):
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
 
@@ -126,19 +176,15 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     
     # Get patron's borrowed books
     borrowed_books = get_patron_borrowed_books(patron_id)
-    print(borrowed_books)
+    logger.debug("patron %s active loans: %d", patron_id, len(borrowed_books))
     
     # Check if the book is borrowed by this patron
-    book_borrowed = False
-    due_date = None
-    for borrowed in borrowed_books:
-        if borrowed['book_id'] == book_id:
-            book_borrowed = True
-            due_date = borrowed['due_date']
-            break
-    
-    if not book_borrowed:
+    borrowed_map = {borrowed['book_id']: borrowed for borrowed in borrowed_books}
+    book_record = borrowed_map.get(book_id)
+    
+    if not book_record:
         return False, "This book was not borrowed by this patron."
+    due_date = book_record['due_date']
 
     # Process return
     return_date = datetime.now()
@@ -158,9 +204,9 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
         return False, "Database error occurred while updating book availability."
     
     # Calculate late fee if applicable
-    if return_date.date() > due_date.date():
-        days_late = (return_date.date() - due_date.date()).days
-        fee_amount = days_late * 0.50  # $0.50 per day late
+    days_late = (return_date.date() - _to_date(due_date)).days
+    if days_late > 0:
+        fee_amount = _fee(days_late)
         return True, f'Book returned successfully but {days_late} days late. Late fee: ${fee_amount:.2f}'
     
     return True, f'Book "{book["title"]}" has been successfully returned.'
@@ -178,7 +224,7 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
         dict: Contains fee amount, days overdue, and status
     """
     # Input validation
-    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+    if not valid_patron_id(patron_id):
         return {
             'fee_amount': 0.00,
             'days_overdue': 0,
@@ -198,11 +244,8 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     borrowed_books = get_patron_borrowed_books(patron_id)
     
     # Find this book in patron's borrowed books
-    book_record = None
-    for borrowed in borrowed_books:
-        if borrowed['book_id'] == book_id:
-            book_record = borrowed
-            break
+    borrowed_map = {borrowed['book_id']: borrowed for borrowed in borrowed_books}
+    book_record = borrowed_map.get(book_id)
     
     if not book_record:
         return {
@@ -212,30 +255,17 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
         }
     
     # Calculate days overdue
-    current_date = datetime.now().date()
-    due_date = book_record['due_date'].date()
+    days_overdue = (datetime.now().date() - _to_date(book_record['due_date'])).days
     
-    if current_date <= due_date:
+    if days_overdue <= 0:
         return {
             'fee_amount': 0.00,
             'days_overdue': 0,
             'status': 'Book not overdue'
         }
     
-    days_overdue = (current_date - due_date).days
-
-    # Calculate fee based on days overdue
-    fee_amount = 0.00
-    if days_overdue <= 7:
-        fee_amount = days_overdue * 0.50  # $0.50 per day for first 7 days
-    else:
-        fee_amount = (7 * 0.50) + ((days_overdue - 7) * 1.00)  # $1.00 per day after 7 days
-    
-    # Cap fee at maximum $15.00
-    fee_amount = min(fee_amount, 15.00)
-    
     return {
-        'fee_amount': round(fee_amount, 2),
+        'fee_amount': round(_fee(days_overdue), 2),
         'days_overdue': days_overdue,
         'status': 'Late fee calculated'
     }
@@ -257,8 +287,7 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
         return []
 
     # Validate search type
-    valid_search_types = ['title', 'author', 'isbn']
-    if search_type not in valid_search_types:
+    if search_type not in _SEARCH_SQL:
         return []
 
     # Clean search term
@@ -268,21 +297,13 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     conn = get_db_connection()
 
     try:
-        if search_type == 'isbn':
-            # Exact match for ISBN
-            books = conn.execute('''
-                SELECT * FROM books 
-                WHERE isbn = ?
-                ORDER BY title
-            ''', (search_term,)).fetchall()
+        # The trigram index only narrows terms of 3+ characters; shorter ones scan faster on books
+        if search_type != 'isbn' and len(search_term) >= 3 and has_books_fts():
+            sql = _FTS_SEARCH_SQL[search_type]
         else:
-            # Partial match for title or author
-            search_pattern = f'%{search_term}%'
-            books = conn.execute(f'''
-                SELECT * FROM books 
-                WHERE {search_type} LIKE ? COLLATE NOCASE
-                ORDER BY title
-            ''', (search_pattern,)).fetchall()
+            sql = _SEARCH_SQL[search_type]
+        param = search_term if search_type == 'isbn' else f'%{search_term}%'
+        books = conn.execute(sql, (param,)).fetchall()
 
         # Convert to list of dictionaries
         results = []
@@ -302,9 +323,6 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
         print(f"Search error: {str(e)}")
         return []
 
-    finally:
-        conn.close()
-
 def get_patron_status_report(patron_id: str) -> Dict:
     """
     Get status report for a patron.
@@ -317,7 +335,7 @@ def get_patron_status_report(patron_id: str) -> Dict:
         dict: Contains patron's borrowing status and history
     """
     # Input validation
-    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+    if not valid_patron_id(patron_id):
         return {
             'error': 'Invalid patron ID. Must be exactly 6 digits.',
             'current_books': [],
@@ -330,20 +348,14 @@ def get_patron_status_report(patron_id: str) -> Dict:
     conn = get_db_connection()
     
     try:
-        # Get currently borrowed books
-        current_books = get_patron_borrowed_books(patron_id)
-        
-        # Calculate total late fees
-        total_fees = 0.00
-        for book in current_books:
-            if book['is_overdue']:
-                fee_info = calculate_late_fee_for_book(patron_id, book['book_id'])
-                total_fees += fee_info['fee_amount']
-        
-        # Get complete borrowing history
+        # Get complete borrowing history with book details in a single query
         history = conn.execute('''
             SELECT 
-                br.*, 
+                br.patron_id,
+                br.book_id,
+                br.borrow_date,
+                br.due_date,
+                br.return_date,
                 b.title, 
                 b.author,
                 b.isbn
@@ -353,28 +365,40 @@ def get_patron_status_report(patron_id: str) -> Dict:
             ORDER BY br.borrow_date DESC
         ''', (patron_id,)).fetchall()
 
-        # Format borrowing history
-        borrow_history = []
-        for record in history:
-            borrow_history.append({
+        # Split out currently borrowed books (oldest loan first), summing late fees in the same pass
+        now = datetime.now()
+        today = now.date()
+        current_books = []
+        total_fees = 0.0
+        for record in reversed(history):
+            if record['return_date']:
+                continue
+            due_date = datetime.fromisoformat(record['due_date'])
+            is_overdue = now > due_date
+            if is_overdue:
+                total_fees += _fee((today - due_date.date()).days)
+            current_books.append({
                 'book_id': record['book_id'],
                 'title': record['title'],
                 'author': record['author'],
-                'isbn': record['isbn'],
-                'borrow_date': datetime.fromisoformat(record['borrow_date']).strftime('%Y-%m-%d'),
-                'due_date': datetime.fromisoformat(record['due_date']).strftime('%Y-%m-%d'),
-                'return_date': datetime.fromisoformat(record['return_date']).strftime('%Y-%m-%d') if record['return_date'] else None,
-                'status': 'Returned' if record['return_date'] else 'Borrowed'
+                'due_date': record['due_date'][:10],
+                'is_overdue': is_overdue
             })
+
+        # Format borrowing history (dates are stored as ISO-8601, so the first 10 chars are YYYY-MM-DD)
+        borrow_history = [{
+            'book_id': record['book_id'],
+            'title': record['title'],
+            'author': record['author'],
+            'isbn': record['isbn'],
+            'borrow_date': record['borrow_date'][:10],
+            'due_date': record['due_date'][:10],
+            'return_date': record['return_date'][:10] if record['return_date'] else None,
+            'status': 'Returned' if record['return_date'] else 'Borrowed'
+        } for record in history]
         
         return {
-            'current_books': [{
-                'book_id': book['book_id'],
-                'title': book['title'],
-                'author': book['author'],
-                'due_date': book['due_date'].strftime('%Y-%m-%d'),
-                'is_overdue': book['is_overdue']
-            } for book in current_books],
+            'current_books': current_books,
             'total_borrowed': len(current_books),
             'total_fees': round(total_fees, 2),
             'borrow_history': borrow_history
@@ -389,9 +413,6 @@ def get_patron_status_report(patron_id: str) -> Dict:
             'total_fees': 0.00,
             'borrow_history': []
         }
-    
-    finally:
-        conn.close()
 
 
 def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway) -> Dict:
@@ -407,7 +428,7 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway)
         dict: Contains success status and message
     """
     # Validate patron ID format
-    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+    if not valid_patron_id(patron_id):
         return {"success": False, "message": "Invalid patron ID"}
     
     # Get book information
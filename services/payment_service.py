@@ -1,4 +1,24 @@
+from .validation import valid_patron_id
+
+
 class PaymentGateway:
+    # Preformatted message builders
+    _processed_msg = "Processed ${:.2f} for patron {}.".format
+    _refunded_msg = "Refunded ${:.2f} to patron {}.".format
+
+    @staticmethod
+    def _validate(patron_id: str, amount: float, kind: str):
+        """
+        Validate a patron ID and amount for a payment or refund.
+
+        Raises:
+            ValueError: if amount or patron ID is invalid.
+        """
+        if amount is None or amount <= 0:
+            raise ValueError(f"Invalid {kind} amount.")
+        if not valid_patron_id(patron_id):
+            raise ValueError(f"Invalid patron ID for {kind}.")
+
     def process_payment(self, patron_id: str, amount: float) -> dict:
         """
         Simulate processing a payment.
@@ -6,13 +26,10 @@ class PaymentGateway:
         Raises:
             ValueError: if amount is invalid.
         """
-        if amount is None or amount <= 0:
-            raise ValueError("Invalid payment amount.")
-        if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-            raise ValueError("Invalid patron ID for payment.")
+        self._validate(patron_id, amount, "payment")
         return {
             "success": True,
-            "message": f"Processed ${amount:.2f} for patron {patron_id}.",
+            "message": self._processed_msg(amount, patron_id),
         }
     
 
@@ -23,11 +40,8 @@ class PaymentGateway:
         Raises:
             ValueError: if amount is invalid.
         """
-        if amount is None or amount <= 0:
-            raise ValueError("Invalid refund amount.")
-        if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-            raise ValueError("Invalid patron ID for refund.")
+        self._validate(patron_id, amount, "refund")
         return {
             "success": True,
-            "message": f"Refunded ${amount:.2f} to patron {patron_id}.",
+            "message": self._refunded_msg(amount, patron_id),
         }
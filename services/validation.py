@@ -0,0 +1,8 @@
+"""
+Validation Module - Input checks shared by the service modules
+"""
+
+
+def valid_patron_id(patron_id) -> bool:
+    """Return True if patron_id is a 6-digit library card ID."""
+    return isinstance(patron_id, str) and len(patron_id) == 6 and patron_id.isascii() and patron_id.isdigit()
@@ -1,32 +1,19 @@
+import random
+
 import pytest
-import sys
-sys.path.insert(0, '../')
 
-from database import init_database, get_db_connection
+from database import insert_book, isbn_exists
 from services.library_service import add_book_to_catalog
 
 
 class TestAddBookToCatalog:
     """Test suite for R1: Add Book To Catalog functionality"""
     
-    def setup_method(self):
-        """Setup test environment before each test"""
-        init_database()
-    
-    def teardown_method(self):
-        """Cleanup after each test"""
-        try:
-            conn = get_db_connection()
-            conn.close()
-        except:
-            pass
-    
     def test_add_book_valid_input(self):
         """
         Positive test: Add book with all valid inputs
         Expected: Success with confirmation message
         """
-        import random
         unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("The Great Gatsby Test", "F. Scott Fitzgerald", unique_isbn, 3)
@@ -39,7 +26,6 @@ class TestAddBookToCatalog:
         Positive test: Add book with minimal valid data (single character title/author)
         Expected: Success
         """
-        import random
         unique_isbn = f"1{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("A", "B", unique_isbn, 1)
@@ -52,7 +38,6 @@ class TestAddBookToCatalog:
         Positive test: Add book with maximum allowed character lengths
         Expected: Success
         """
-        import random
         unique_isbn = f"2{str(random.randint(100000000000, 999999999999))}"
         
         long_title = "A" * 200  # Exactly 200 characters
@@ -68,7 +53,6 @@ class TestAddBookToCatalog:
         Positive test: Verify whitespace is properly trimmed from title and author
         Expected: Success with trimmed values
         """
-        import random
         unique_isbn = f"3{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("  Spaced Title  ", "  Spaced Author  ", unique_isbn, 2)
@@ -82,7 +66,6 @@ class TestAddBookToCatalog:
         Negative test: Empty title
         Expected: Failure with appropriate error message
         """
-        import random
         unique_isbn = f"4{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("", "Valid Author", unique_isbn, 1)
@@ -95,7 +78,6 @@ class TestAddBookToCatalog:
         Negative test: Title with only whitespace
         Expected: Failure with appropriate error message
         """
-        import random
         unique_isbn = f"5{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("   ", "Valid Author", unique_isbn, 1)
@@ -108,7 +90,6 @@ class TestAddBookToCatalog:
         Negative test: Title exceeds 200 character limit
         Expected: Failure with length validation error
         """
-        import random
         unique_isbn = f"6{str(random.randint(100000000000, 999999999999))}"
         
         long_title = "A" * 201  # 201 characters (over limit)
@@ -122,7 +103,6 @@ class TestAddBookToCatalog:
         Negative test: Empty author
         Expected: Failure with appropriate error message
         """
-        import random
         unique_isbn = f"7{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Valid Title", "", unique_isbn, 1)
@@ -135,7 +115,6 @@ class TestAddBookToCatalog:
         Negative test: Author exceeds 100 character limit
         Expected: Failure with length validation error
         """
-        import random
         unique_isbn = f"8{str(random.randint(100000000000, 999999999999))}"
         
         long_author = "B" * 101  # 101 characters (over limit)
@@ -164,7 +143,6 @@ class TestAddBookToCatalog:
         assert success == False
         assert "13" in message or "isbn" in message.lower() or "digit" in message.lower()
     
-    @pytest.mark.skip()
     def test_add_book_isbn_with_letters(self):
         """
         Negative test: ISBN containing non-digit characters
@@ -181,7 +159,6 @@ class TestAddBookToCatalog:
         Negative test: Zero total copies
         Expected: Failure with positive integer validation error
         """
-        import random
         unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Valid Title", "Valid Author", unique_isbn, 0)
@@ -194,8 +171,7 @@ class TestAddBookToCatalog:
         Negative test: Negative total copies
         Expected: Failure with positive integer validation error
         """
-        import random
-        unique_isbn = f"A{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Valid Title", "Valid Author", unique_isbn, -1)
         
@@ -207,8 +183,7 @@ class TestAddBookToCatalog:
         Negative test: Non-integer total copies (string)
         Expected: Failure with integer validation error
         """
-        import random
-        unique_isbn = f"B{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Valid Title", "Valid Author", unique_isbn, "5")
         
@@ -220,8 +195,7 @@ class TestAddBookToCatalog:
         Negative test: Float value for total copies
         Expected: Failure with integer validation error
         """
-        import random
-        unique_isbn = f"C{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Valid Title", "Valid Author", unique_isbn, 5.5)
         
@@ -233,8 +207,7 @@ class TestAddBookToCatalog:
         Positive test: Title containing special characters
         Expected: Success
         """
-        import random
-        unique_isbn = f"D{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Book! @#$%^&*()", "Valid Author", unique_isbn, 1)
         
@@ -246,8 +219,7 @@ class TestAddBookToCatalog:
         Positive test: Title and author with Unicode characters
         Expected: Success
         """
-        import random
-        unique_isbn = f"E{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("título del libro", "José García", unique_isbn, 1)
         
@@ -259,8 +231,7 @@ class TestAddBookToCatalog:
         Positive test: Title containing numbers
         Expected: Success
         """
-        import random
-        unique_isbn = f"F{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Book 123", "Valid Author", unique_isbn, 1)
         
@@ -272,9 +243,8 @@ class TestAddBookToCatalog:
         Positive test: Same title but different ISBN
         Expected: Success
         """
-        import random
-        isbn1 = f"G{str(random.randint(100000000000, 999999999999))}"
-        isbn2 = f"H{str(random.randint(100000000000, 999999999999))}"
+        isbn1 = f"9{str(random.randint(100000000000, 999999999999))}"
+        isbn2 = f"9{str(random.randint(100000000000, 999999999999))}"
         
         add_book_to_catalog("Duplicate Title Test", "Author One", isbn1, 1)
         success, message = add_book_to_catalog("Duplicate Title Test", "Author Two", isbn2, 1)
@@ -287,8 +257,7 @@ class TestAddBookToCatalog:
         Positive test: Large number of copies
         Expected: Success
         """
-        import random
-        unique_isbn = f"I{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Valid Title", "Valid Author", unique_isbn, 999999)
         
@@ -300,8 +269,7 @@ class TestAddBookToCatalog:
         Positive test: Title consisting only of numbers
         Expected: Success
         """
-        import random
-        unique_isbn = f"J{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("12345", "Valid Author", unique_isbn, 1)
         
@@ -313,8 +281,7 @@ class TestAddBookToCatalog:
         Negative test: None as title
         Expected: Failure with appropriate error message
         """
-        import random
-        unique_isbn = f"K{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog(None, "Valid Author", unique_isbn, 1)
         
@@ -326,15 +293,13 @@ class TestAddBookToCatalog:
         Negative test: None as author
         Expected: Failure with appropriate error message
         """
-        import random
-        unique_isbn = f"L{str(random.randint(100000000000, 999999999999))}"
+        unique_isbn = f"9{str(random.randint(100000000000, 999999999999))}"
         
         success, message = add_book_to_catalog("Valid Title", None, unique_isbn, 1)
         
         assert success == False
         assert "author" in message.lower() or "required" in message.lower()
 
-    @pytest.mark.skip()
     def test_add_book_invalid_isbn_letters_and_numbers(self):
         """
         Negative test: ISBN with mix of letters and numbers but correct length
@@ -346,7 +311,6 @@ class TestAddBookToCatalog:
         # May fail with different messages depending on validation order
         assert "13" in message or "digit" in message.lower() or "isbn" in message.lower() or "exists" in message.lower()
 
-    @pytest.mark.skip()
     def test_add_book_special_characters_in_isbn(self):
         """
         Negative test: ISBN with special characters
@@ -356,4 +320,47 @@ class TestAddBookToCatalog:
         
         assert success == False
         # May fail with different messages depending on validation order
-        assert "13" in message or "digit" in message.lower() or "isbn" in message.lower() or "exists" in message.lower()
\ No newline at end of file
+        assert "13" in message or "digit" in message.lower() or "isbn" in message.lower() or "exists" in message.lower()
+
+
+class TestIsbnExistsCache:
+    """Test the cached ISBN duplicate check stays correct across inserts"""
+
+    def test_add_book_then_duplicate_rejected(self):
+        """
+        Test: A cached "not found" ISBN is added, then added again
+        Expected: First add succeeds, second is rejected as a duplicate
+        """
+        isbn = f"9{random.randint(100000000000, 999999999999)}"
+        assert isbn_exists(isbn) is False  # caches the negative result
+
+        success, message = add_book_to_catalog("Cache Test Book", "Cache Author", isbn, 1)
+        assert success == True
+        assert isbn_exists(isbn) is True
+
+        success, message = add_book_to_catalog("Cache Test Book", "Cache Author", isbn, 1)
+        assert success == False
+        assert "already exists" in message
+
+    def test_insert_conflict_clears_stale_isbn_entry(self, conn):
+        """
+        Test: Another writer adds an ISBN the cache has recorded as missing
+        Expected: The failed insert drops the stale entry and the next check sees the book
+        """
+        isbn = f"9{random.randint(100000000000, 999999999999)}"
+        assert isbn_exists(isbn) is False
+
+        # Insert behind the cache's back, leaving it stale
+        conn.execute('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies)
+            VALUES ('Other Writer Book', 'Other Author', ?, 1, 1)
+        ''', (isbn,))
+        conn.commit()
+        assert isbn_exists(isbn) is False
+
+        assert insert_book("Cache Test Book", "Cache Author", isbn, 1, 1) is False
+        assert isbn_exists(isbn) is True
+
+        success, message = add_book_to_catalog("Cache Test Book", "Cache Author", isbn, 1)
+        assert success == False
+        assert "already exists" in message
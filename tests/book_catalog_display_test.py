@@ -1,25 +1,19 @@
+import random
+
 import pytest
-import sys
-sys.path.insert(0, '../')
 
-from database import init_database, add_sample_data, get_db_connection
-from services.library_service import get_all_books, add_book_to_catalog
+import database
+
+from database import get_db_connection, insert_book, checkout_book_copy
+from services.library_service import get_all_books, add_book_to_catalog, get_books_index_by_isbn
+
+@pytest.fixture(scope="class")
+def books_snapshot():
+    """Catalog fetched once and shared by the read-only structural tests."""
+    return get_all_books()
 
 class TestBookCatalogDisplay:
 
-    def setup_method(self):
-        """Initialize database before each test"""
-        init_database()
-        add_sample_data()
-    
-    def teardown_method(self):
-        """Cleanup after each test"""
-        try:
-            conn = get_db_connection()
-            conn.close()
-        except:
-            pass
-    
     def test_get_all_books_not_empty(self):
         """
         Test that catalog returns books when database is populated
@@ -29,37 +23,32 @@ class TestBookCatalogDisplay:
         assert len(books) > 0
         assert isinstance(books, list)
     
-    def test_book_catalog_structure(self):
+    def test_book_catalog_structure(self, books_snapshot):
         """
         Test that each book entry contains all required fields
         Expected: All required fields present with correct types
         """
-        books = get_all_books()
+        books = books_snapshot
         required_fields = ['id', 'title', 'author', 'isbn', 'total_copies', 'available_copies']
         
-        if len(books) > 0:
-            for book in books:
-                assert isinstance(book, dict)
-                for field in required_fields:
-                    assert field in book
-                
-                # Verify field types
-                assert isinstance(book['id'], int)
-                assert isinstance(book['title'], str)
-                assert isinstance(book['author'], str)
-                assert isinstance(book['isbn'], str)
-                assert isinstance(book['total_copies'], int)
-                assert isinstance(book['available_copies'], int)
+        assert all(isinstance(book, dict) for book in books)
+        assert all(field in book for book in books for field in required_fields)
+        
+        # Verify field types
+        assert all(isinstance(book['id'], int) and
+                   isinstance(book['title'], str) and
+                   isinstance(book['author'], str) and
+                   isinstance(book['isbn'], str) and
+                   isinstance(book['total_copies'], int) and
+                   isinstance(book['available_copies'], int)
+                   for book in books)
     
-    def test_available_copies_less_or_equal_total(self):
+    def test_available_copies_less_or_equal_total(self, books_snapshot):
         """
         Test that available copies is always <= total copies
         Expected: Available copies not exceeding total copies
         """
-        books = get_all_books()
-        for book in books:
-            assert book['available_copies'] <= book['total_copies']
-            assert book['available_copies'] >= 0
+        assert all(0 <= book['available_copies'] <= book['total_copies'] for book in books_snapshot)
     
     def test_catalog_alphabetical_order(self):
         """
@@ -78,7 +67,6 @@ class TestBookCatalogDisplay:
         Expected: New book present in catalog
         """
         # Use unique ISBN to avoid conflicts
-        import random
         unique_isbn = f"7{str(random.randint(100000000000, 999999999999))}"
         
         new_book = {
@@ -93,16 +81,11 @@ class TestBookCatalogDisplay:
         
         # Only check if add was successful
         if success:
-            books = get_all_books()
-            found = False
-            for book in books:
-                if (book['title'] == new_book['title'] and 
-                    book['author'] == new_book['author'] and 
-                    book['isbn'] == new_book['isbn']):
-                    found = True
-                    break
+            book = get_books_index_by_isbn().get(new_book['isbn'])
             
-            assert found == True
+            assert book is not None
+            assert book['title'] == new_book['title']
+            assert book['author'] == new_book['author']
     
     def test_catalog_with_zero_available_copies(self):
         """
@@ -123,52 +106,43 @@ class TestBookCatalogDisplay:
         books = get_all_books()
         book_ids = [book['id'] for book in books]
         assert len(book_ids) == len(set(book_ids))
+        assert len(get_books_index_by_isbn()) == len(books)
     
-    def test_valid_isbn_format(self):
+    def test_valid_isbn_format(self, books_snapshot):
         """
         Test that all ISBNs in catalog are valid 13-digit numbers
         Expected: All ISBNs are 13 digits
         """
-        books = get_all_books()
-        for book in books:
-            assert len(book['isbn']) == 13, f"ISBN {book['isbn']} is not 13 digits"
-            # May have non-digit ISBNs from previous failed tests
-            # Just check length for now
+        bad = [book['isbn'] for book in books_snapshot
+               if len(book['isbn']) != 13 or not book['isbn'].isdigit()]
+        assert not bad, f"ISBNs not 13 digits: {bad}"
     
-    def test_non_empty_required_fields(self):
+    def test_non_empty_required_fields(self, books_snapshot):
         """
         Test that no required fields are empty
         Expected: No empty required fields
         """
-        books = get_all_books()
-        for book in books:
-            assert book['title'].strip() != ""
-            assert book['author'].strip() != ""
-            assert book['isbn'].strip() != ""
+        assert all(book['title'].strip() and book['author'].strip() and book['isbn'].strip()
+                   for book in books_snapshot)
     
-    def test_positive_copy_numbers(self):
+    def test_positive_copy_numbers(self, books_snapshot):
         """
         Test that copy numbers are non-negative
         Expected: All copy counts >= 0
         """
-        books = get_all_books()
-        for book in books:
-            assert book['total_copies'] > 0
-            assert book['available_copies'] >= 0
+        assert all(book['total_copies'] > 0 and book['available_copies'] >= 0 for book in books_snapshot)
 
     def test_empty_catalog_after_init(self):
         """
         Test catalog state with fresh database
         Expected: Empty list when no books added
         """
-        from database import get_db_connection
         
         # Manually clear the database
         conn = get_db_connection()
         conn.execute('DELETE FROM books')
         conn.execute('DELETE FROM borrow_records')
         conn.commit()
-        conn.close()
         
         books = get_all_books()
         assert len(books) == 0
@@ -180,7 +154,6 @@ class TestBookCatalogDisplay:
         Expected: Correct total and available copy counts
         """
         # Use unique ISBN to avoid conflicts
-        import random
         unique_isbn = f"8{str(random.randint(100000000000, 999999999999))}"
         
         success, _ = add_book_to_catalog("Multiple Copies Book", "Test Author", 
@@ -188,13 +161,71 @@ class TestBookCatalogDisplay:
         
         # Only proceed if add was successful
         if success:
-            books = get_all_books()
-            multi_copy_book = None
-            for book in books:
-                if book['isbn'] == unique_isbn:
-                    multi_copy_book = book
-                    break
+            idx = get_books_index_by_isbn()
             
-            assert multi_copy_book is not None
+            assert unique_isbn in idx
+            multi_copy_book = idx[unique_isbn]
             assert multi_copy_book['total_copies'] == 5
-            assert multi_copy_book['available_copies'] == 5
\ No newline at end of file
+            assert multi_copy_book['available_copies'] == 5
+
+
+class TestBookCatalogCache:
+    """Test the cached catalog is isolated from callers and refreshed on writes"""
+
+    def test_modifying_returned_books_leaves_catalog_intact(self):
+        """
+        Test: Caller mutates rows from get_all_books and get_books_index_by_isbn
+        Expected: Later reads still return the stored values
+        """
+        books = get_all_books()
+        original_title = books[0]['title']
+        books[0]['title'] = 'Tampered'
+        isbn, book = next(iter(get_books_index_by_isbn().items()))
+        book['available_copies'] = -1
+
+        assert get_all_books()[0]['title'] == original_title
+        assert get_books_index_by_isbn()[isbn]['available_copies'] >= 0
+
+    def test_insert_book_refreshes_catalog(self):
+        """
+        Test: Book inserted after the catalog was cached
+        Expected: Next read includes it
+        """
+        get_all_books()
+        isbn = f"9{random.randint(100000000000, 999999999999)}"
+        assert insert_book("Cache Refresh Book", "Cache Author", isbn, 2, 2) is True
+
+        assert isbn in get_books_index_by_isbn()
+
+    def test_checkout_book_copy_refreshes_catalog(self):
+        """
+        Test: A copy is checked out after the catalog was cached
+        Expected: Next read shows one fewer available copy
+        """
+        before = next(book for book in get_all_books() if book['id'] == 1)['available_copies']
+        assert checkout_book_copy(1) is True
+
+        after = next(book for book in get_all_books() if book['id'] == 1)['available_copies']
+        assert after == before - 1
+
+    def test_write_during_read_is_not_cached(self, conn, monkeypatch):
+        """
+        Test: A copy is checked out after a catalog read ran but before it was cached
+        Expected: The pre-checkout read is not cached, so the next read sees the checkout
+        """
+        before = next(book for book in get_all_books() if book['id'] == 1)['available_copies']
+        database.invalidate_all_books_cache()
+
+        class CheckoutDuringRead:
+            """Connection whose catalog query is followed by a concurrent-style checkout"""
+            def execute(self, *args):
+                rows = conn.execute(*args).fetchall()
+                monkeypatch.undo()
+                assert checkout_book_copy(1) is True
+                return rows
+
+        monkeypatch.setattr(database, "get_db_connection", lambda: CheckoutDuringRead())
+        get_all_books()
+
+        after = next(book for book in get_all_books() if book['id'] == 1)['available_copies']
+        assert after == before - 1
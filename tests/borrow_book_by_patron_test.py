@@ -1,32 +1,14 @@
 import pytest
-import sys
-sys.path.insert(0, '../')
 
-from database import init_database
-from datetime import datetime, timedelta
+from datetime import timedelta
 from services.library_service import borrow_book_by_patron
 
 
 class TestBorrowBookByPatron:
     """Test suite for R3: Book Borrowing functionality"""
     
-    def setup_method(self):
-        """Setup test environment before each test"""
-        init_database()
-        from database import add_sample_data
-        add_sample_data() 
-    
-    def teardown_method(self):
-        """Cleanup after each test"""
-        try:
-            from database import get_db_connection
-            conn = get_db_connection()
-            conn.close()
-        except:
-            pass
-    
     @pytest.mark.skip()
-    def test_borrow_book_valid_request(self):
+    def test_borrow_book_valid_request(self, now):
         """
         Positive test: Valid patron borrows available book
         Expected: Success with due date message
@@ -37,7 +19,7 @@ class TestBorrowBookByPatron:
         assert success == True
         assert "successfully borrowed" in message.lower() or "borrowed" in message.lower()
         # Check for due date information (may be in different formats)
-        assert "due" in message.lower() or datetime.now().strftime("%Y") in message
+        assert "due" in message.lower() or now.strftime("%Y") in message
     
     @pytest.mark.skip()
     def test_borrow_book_different_valid_patron(self):
@@ -51,65 +33,25 @@ class TestBorrowBookByPatron:
         assert "successfully borrowed" in message.lower() or "borrowed" in message.lower()
     
     # Patron ID Validation Tests
-    def test_borrow_book_empty_patron_id(self):
-        """
-        Negative test: Empty patron ID
-        Expected: Failure with validation error
-        """
-        success, message = borrow_book_by_patron("", 1)
-        
-        assert success == False
-        assert "invalid patron id" in message.lower() or "patron" in message.lower()
-    
-    def test_borrow_book_none_patron_id(self):
-        """
-        Negative test: None patron ID
-        Expected: Failure with validation error
-        """
-        success, message = borrow_book_by_patron(None, 1)
-        
-        assert success == False
-        assert "invalid patron id" in message.lower() or "patron" in message.lower()
-    
-    def test_borrow_book_patron_id_too_short(self):
-        """
-        Negative test: Patron ID less than 6 digits
-        Expected: Failure with validation error
-        """
-        success, message = borrow_book_by_patron("12345", 1)
-        
-        assert success == False
-        assert "invalid patron id" in message.lower() or "6 digits" in message.lower()
-    
-    def test_borrow_book_patron_id_too_long(self):
-        """
-        Negative test: Patron ID more than 6 digits
-        Expected: Failure with validation error
-        """
-        success, message = borrow_book_by_patron("1234567", 1)
-        
-        assert success == False
-        assert "invalid patron id" in message.lower() or "6 digits" in message.lower()
-    
-    def test_borrow_book_patron_id_with_letters(self):
-        """
-        Negative test: Patron ID containing non-digit characters
-        Expected: Failure with validation error
-        """
-        success, message = borrow_book_by_patron("12345A", 1)
-        
-        assert success == False
-        assert "invalid patron id" in message.lower() or "patron" in message.lower()
-    
-    def test_borrow_book_patron_id_with_spaces(self):
-        """
-        Negative test: Patron ID with spaces
-        Expected: Failure with validation error
+    @pytest.mark.parametrize("patron_id", [
+        "",            # empty
+        None,          # missing
+        "12345",       # too short
+        "1234567",     # too long
+        "12345A",      # letters
+        "12 34 56",    # spaces
+        "12@456",      # special characters
+        " 123456 ",    # leading/trailing whitespace
+    ])
+    def test_borrow_book_invalid_patron_id(self, patron_id):
+        """
+        Negative test: Malformed patron IDs
+        Expected: Failure with invalid patron ID
         """
-        success, message = borrow_book_by_patron("12 34 56", 1)
+        success, message = borrow_book_by_patron(patron_id, 1)
         
         assert success == False
-        assert "invalid patron id" in message.lower() or "patron" in message.lower()
+        assert "invalid patron id" in message.lower()
     
     # Book Validation Tests
     def test_borrow_nonexistent_book(self):
@@ -136,26 +78,17 @@ class TestBorrowBookByPatron:
             assert "not available" in message.lower() or "available" in message.lower()
         # If it succeeds, that's also acceptable (book was available)
     
-    def test_borrow_book_negative_book_id(self):
+    @pytest.mark.parametrize("book_id", [-1, 0, 1.5])
+    def test_borrow_book_invalid_book_id(self, book_id):
         """
-        Negative test: Negative book ID
+        Negative test: Negative, zero or non-integer book ID
         Expected: Failure with book not found
         """
-        success, message = borrow_book_by_patron("123456", -1)
+        success, message = borrow_book_by_patron("123456", book_id)
         
         assert success == False
         assert "book not found" in message.lower() or "not found" in message.lower() or "invalid" in message.lower()
     
-    def test_borrow_book_zero_book_id(self):
-        """
-        Negative test: Zero book ID
-        Expected: Failure with book not found
-        """
-        success, message = borrow_book_by_patron("123456", 0)
-        
-        assert success == False
-        assert "book not found" in message.lower() or "not found" in message.lower() or "invalid" in message.lower()
-
     @pytest.mark.skip()
     def test_borrow_multiple_books_within_limit(self):
         """
@@ -217,7 +150,7 @@ class TestBorrowBookByPatron:
         assert "not available" in message.lower() or "already" in message.lower() or "borrowed" in message.lower()
     
     @pytest.mark.skip()
-    def test_borrow_book_due_date_calculation(self):
+    def test_borrow_book_due_date_calculation(self, now):
         """
         Positive test: Verify due date is exactly 14 days from borrow date
         Expected: Success with correct due date
@@ -226,9 +159,10 @@ class TestBorrowBookByPatron:
         
         assert success == True
         # Due date should be mentioned in some form
-        expected_date = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")
+        expected_date = (now + timedelta(days=14)).strftime("%Y-%m-%d")
+        expected_month = now.strftime("%Y-%m")
         # Check if the date or at least the year/month is in the message
-        assert expected_date in message or datetime.now().strftime("%Y-%m") in message or "due" in message.lower()
+        assert expected_date in message or expected_month in message or "due" in message.lower()
     
     def test_borrow_book_last_copy(self):
         """
@@ -266,33 +200,3 @@ class TestBorrowBookByPatron:
         # At least one should process (may both succeed if multiple copies available)
         assert isinstance(success1, bool)
         assert isinstance(success2, bool)
-    
-    def test_borrow_book_float_book_id(self):
-        """
-        Negative test: Book ID as float
-        Expected: Failure with invalid book ID
-        """
-        success, message = borrow_book_by_patron("123456", 1.5)
-        
-        assert success == False
-        assert "book not found" in message.lower() or "invalid" in message.lower() or "not found" in message.lower()
-    
-    def test_borrow_book_special_chars_patron_id(self):
-        """
-        Negative test: Patron ID with special characters
-        Expected: Failure with invalid patron ID
-        """
-        success, message = borrow_book_by_patron("12@456", 1)
-        
-        assert success == False
-        assert "invalid patron id" in message.lower() or "patron" in message.lower() or "invalid" in message.lower()
-    
-    def test_borrow_book_whitespace_patron_id(self):
-        """
-        Negative test: Patron ID with leading/trailing whitespace
-        Expected: Failure with invalid patron ID
-        """
-        success, message = borrow_book_by_patron(" 123456 ", 1)
-        
-        assert success == False
-        assert "invalid patron id" in message.lower() or "patron" in message.lower() or "invalid" in message.lower()
\ No newline at end of file
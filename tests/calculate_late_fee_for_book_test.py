@@ -1,20 +1,17 @@
 import pytest
-import sys
-sys.path.insert(0, '../')
 
-from database import init_database, get_db_connection
-from datetime import datetime, timedelta
+from database import get_db_connection
+from datetime import timedelta
 
-from services.library_service import calculate_late_fee_for_book
+from services.library_service import calculate_late_fee_for_book, borrow_book_by_patron, return_book_by_patron
 
 class TestLateFeeValidation:
     """Test patron ID and book ID validation"""
     
-    def setup_method(self):
+    @pytest.fixture(autouse=True)
+    def setup_loans(self, now):
         """Setup test environment before each test"""
-        init_database()
         # Setup borrowed books for testing
-        from services.library_service import borrow_book_by_patron
         
         # Borrow books and manipulate due dates for testing
         borrow_book_by_patron("111111", 1)  # Will be 5 days overdue
@@ -22,31 +19,15 @@ class TestLateFeeValidation:
         
         # Adjust due dates in database
         conn = get_db_connection()
-        five_days_overdue = (datetime.now() - timedelta(days=5)).isoformat()
-        ten_days_overdue = (datetime.now() - timedelta(days=10)).isoformat()
+        five_days_overdue = (now - timedelta(days=5)).isoformat()
+        ten_days_overdue = (now - timedelta(days=10)).isoformat()
         
-        conn.execute('''
-            UPDATE borrow_records 
-            SET due_date = ? 
-            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (five_days_overdue, "111111", 1))
-        
-        conn.execute('''
+        conn.executemany('''
             UPDATE borrow_records 
             SET due_date = ? 
             WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (ten_days_overdue, "222222", 2))
-        
+        ''', [(five_days_overdue, "111111", 1), (ten_days_overdue, "222222", 2)])
         conn.commit()
-        conn.close()
-    
-    def teardown_method(self):
-        """Cleanup after each test"""
-        try:
-            conn = get_db_connection()
-            conn.close()
-        except:
-            pass
     
     def test_late_fee_empty_patron_id(self):
         """
@@ -129,7 +110,6 @@ class TestLateFeeValidation:
         Test: Book returned on time
         Expected: No late fee
         """
-        from services.library_service import borrow_book_by_patron
         success, _ = borrow_book_by_patron("333333", 3)  # Fresh borrow
         
         # Skip if borrow failed
@@ -173,13 +153,13 @@ class TestLateFeeValidation:
         assert result.get('fee_amount') == pytest.approx(6.50, abs=0.01)  # (7 * $0.50) + (3 * $1.00)
 
     @pytest.mark.skip()
-    def test_late_fee_maximum_cap(self):
+    def test_late_fee_maximum_cap(self, now):
         """
         Test: Book overdue long enough to exceed maximum fee
         Expected: Fee capped at $15.00
         """
         conn = get_db_connection()
-        thirty_days_overdue = (datetime.now() - timedelta(days=30)).isoformat()
+        thirty_days_overdue = (now - timedelta(days=30)).isoformat()
         
         conn.execute('''
             UPDATE borrow_records 
@@ -187,7 +167,6 @@ class TestLateFeeValidation:
             WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
         ''', (thirty_days_overdue, "222222", 2))
         conn.commit()
-        conn.close()
         
         result = calculate_late_fee_for_book("222222", 2)
         
@@ -226,8 +205,8 @@ class TestLateFeeValidation:
         
         assert result.get('status') in ['success', 'Late fee calculated']
         assert isinstance(result.get('fee_amount'), (int, float))
-        # Use pytest.approx instead of string comparison
-        assert result.get('fee_amount') == pytest.approx(2.50, abs=0.01)
+        # Compare in whole cents instead of formatting the float
+        assert round(result['fee_amount'] * 100) == 250
 
     @pytest.mark.skip()
     def test_multiple_overdue_books(self):
@@ -254,7 +233,6 @@ class TestLateFeeValidation:
         Test: Calculate fee for already returned book
         Expected: Error status
         """
-        from services.library_service import return_book_by_patron
         return_book_by_patron("111111", 1)
         
         result = calculate_late_fee_for_book("111111", 1)
@@ -272,7 +250,6 @@ class TestLateFeeValidation:
         Test: Calculate fee for book not yet due
         Expected: Zero fee
         """
-        from services.library_service import borrow_book_by_patron
         borrow_book_by_patron("555555", 3)  # Fresh borrow with future due date
         
         result = calculate_late_fee_for_book("555555", 3)
@@ -286,7 +263,7 @@ class TestLateFeeValidation:
         assert result.get('days_overdue', 0) == 0
 
     @pytest.mark.skip()
-    def test_fee_calculation_boundary_cases(self):
+    def test_fee_calculation_boundary_cases(self, now):
         """
         Test: Fee calculation at boundary conditions
         Expected: Correct fee amounts
@@ -294,14 +271,13 @@ class TestLateFeeValidation:
         conn = get_db_connection()
         
         # Test exactly 7 days overdue
-        seven_days_overdue = (datetime.now() - timedelta(days=7)).isoformat()
+        seven_days_overdue = (now - timedelta(days=7)).isoformat()
         conn.execute('''
             UPDATE borrow_records 
             SET due_date = ? 
             WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
         ''', (seven_days_overdue, "111111", 1))
         conn.commit()
-        conn.close()
         
         result = calculate_late_fee_for_book("111111", 1)
         
@@ -1,52 +1,26 @@
+import json
+
 import pytest
-import sys
-sys.path.insert(0, '../')
 
-from database import init_database, get_db_connection
 from datetime import datetime, timedelta
-from services.library_service import get_patron_status_report, borrow_book_by_patron
+from app import create_app
+from services.library_service import get_patron_status_report
 
-class TestPatronStatusReport:
-    """Test suite for R7: Patron Status Report functionality"""
-    
-    def setup_method(self):
-        """Setup test environment before each test"""
-        init_database()
-        # Setup test data
-        self._setup_test_data()
-    
-    def _setup_test_data(self):
-        """Create test data for patron status testing"""
-        # Create a patron with multiple borrowed books
-        patron_id = "111111"
-        borrow_book_by_patron(patron_id, 1)  # Borrow first book
-        borrow_book_by_patron(patron_id, 2)  # Borrow second book
-        
-        # Create an overdue book scenario
-        conn = get_db_connection()
-        past_date = (datetime.now() - timedelta(days=20)).isoformat()
-        conn.execute('''
-            UPDATE borrow_records 
-            SET due_date = ? 
-            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (past_date, patron_id, 1))
-        conn.commit()
-        conn.close()
+class TestPatronStatusValidation:
+    """Test patron ID validation (rejected before any database access, so no setup data)"""
     
-    def teardown_method(self):
-        """Cleanup after each test"""
-        try:
-            conn = get_db_connection()
-            conn.close()
-        except:
-            pass
-    
-    def test_patron_status_empty_patron_id(self):
-        """
-        Test: Empty patron ID
-        Expected: Should return error status
+    @pytest.mark.parametrize("patron_id", [
+        "",        # empty
+        "12345",   # too short
+        123456,    # integer instead of string
+        "12@456",  # special characters
+    ])
+    def test_patron_status_invalid_patron_id(self, patron_id):
+        """
+        Negative test: Malformed patron IDs
+        Expected: Error status with message
         """
-        result = get_patron_status_report("")
+        result = get_patron_status_report(patron_id)
         
         assert isinstance(result, dict)
         # Accept multiple error formats
@@ -56,21 +30,33 @@ class TestPatronStatusReport:
         
         assert 'error' in combined or 'invalid' in combined
         assert 'patron' in combined or 'invalid' in combined
+
+class TestPatronStatusReport:
+    """Test suite for R7: Patron Status Report functionality"""
     
-    def test_patron_status_invalid_patron_id_length(self):
-        """
-        Test: Invalid patron ID length
-        Expected: Should return error for non-6-digit patron ID
-        """
-        result = get_patron_status_report("12345")  # Too short
-        assert isinstance(result, dict)
-        
-        status = result.get('status', result.get('error', ''))
-        message = result.get('message', result.get('error', ''))
-        combined = (str(status) + ' ' + str(message)).lower()
-        
-        assert 'error' in combined or 'invalid' in combined
-        assert '6 digits' in combined or 'invalid patron id' in combined or 'patron' in combined
+    @pytest.fixture(autouse=True)
+    def setup_patron(self, conn, insert_borrow, now):
+        """Setup test environment before each test"""
+        # Setup test data
+        self._setup_test_data(conn, insert_borrow, now)
+    
+    def _setup_test_data(self, conn, insert_borrow, now):
+        """Create test data for patron status testing"""
+        # Create a patron with multiple borrowed books, the first one overdue
+        patron_id = "111111"
+        insert_borrow(patron_id, 1, now - timedelta(days=20))
+        insert_borrow(patron_id, 2, now + timedelta(days=14))
+        conn.commit()
+    
+    @pytest.fixture
+    def report_111111(self):
+        """Status report for the patron created in _setup_test_data"""
+        return get_patron_status_report("111111")
+    
+    @pytest.fixture
+    def report_999999(self):
+        """Status report for a patron with no borrows"""
+        return get_patron_status_report("999999")
     
     def test_patron_status_valid_patron_with_books(self):
         """
@@ -190,39 +176,20 @@ class TestPatronStatusReport:
         assert isinstance(result, dict)
         
         # Test JSON serializability
-        import json
         try:
-            json_str = json.dumps(result, default=str)  # default=str handles datetime
+            json_str = json.dumps(result)  # dates are returned as YYYY-MM-DD strings
             parsed = json.loads(json_str)
             assert isinstance(parsed, dict)
         except (TypeError, ValueError) as e:
             pytest.fail(f"Result should be JSON serializable: {e}")
     
-    def test_patron_status_invalid_parameter_types(self):
-        """
-        Test: Handle invalid parameter types
-        Expected: Should handle gracefully
-        """
-        try:
-            result = get_patron_status_report(123456)  # Integer instead of string
-            
-            assert isinstance(result, dict)
-            # Should indicate error in some way
-            has_error = (result.get('status') == 'error' or 
-                        'error' in result or 
-                        'invalid' in str(result).lower())
-            assert has_error
-        except (AttributeError, TypeError):
-            # Function may raise error for invalid type, which is also acceptable
-            pass
-
     @pytest.mark.skip()
-    def test_patron_status_valid_patron_comprehensive(self):
+    def test_patron_status_valid_patron_comprehensive(self, report_111111):
         """
         Positive test: Full patron status with borrowed and overdue books
         Expected: Complete status report with all required fields
         """
-        result = get_patron_status_report("111111")
+        result = report_111111
         
         # Skip if borrowing failed in setup
         if 'error' in str(result).lower():
@@ -239,12 +206,12 @@ class TestPatronStatusReport:
         assert num_borrowed >= 1
         assert isinstance(history, list)
 
-    def test_patron_status_borrowed_books_details(self):
+    def test_patron_status_borrowed_books_details(self, report_111111):
         """
         Test: Verify borrowed books contain all required details
         Expected: Complete book information with due dates
         """
-        result = get_patron_status_report("111111")
+        result = report_111111
         
         borrowed_books = result.get('currently_borrowed_books', result.get('current_books', []))
         
@@ -256,12 +223,12 @@ class TestPatronStatusReport:
                 if 'due_date' in book:
                     assert isinstance(book['due_date'], str) or isinstance(book['due_date'], datetime)
 
-    def test_patron_status_late_fees_calculation(self):
+    def test_patron_status_late_fees_calculation(self, report_111111):
         """
         Test: Verify late fees are calculated correctly
         Expected: Accurate late fee calculation
         """
-        result = get_patron_status_report("111111")
+        result = report_111111
         
         fees = result.get('total_late_fees_owed', result.get('total_fees', 0))
         
@@ -269,12 +236,12 @@ class TestPatronStatusReport:
         assert fees <= 30.00  # Maximum for 2 books
         assert fees >= 0.00
 
-    def test_patron_status_borrowing_history_complete(self):
+    def test_patron_status_borrowing_history_complete(self, report_111111):
         """
         Test: Verify borrowing history contains all transactions
         Expected: Complete borrowing history with details
         """
-        result = get_patron_status_report("111111")
+        result = report_111111
         
         history = result.get('borrowing_history', result.get('borrow_history', []))
         
@@ -285,12 +252,12 @@ class TestPatronStatusReport:
                 has_info = 'book_id' in record or 'title' in record
                 assert has_info
 
-    def test_patron_status_json_structure(self):
+    def test_patron_status_json_structure(self, report_111111):
         """
         Test: Verify JSON structure of response
         Expected: Well-formed JSON with all required fields
         """
-        result = get_patron_status_report("111111")
+        result = report_111111
         
         # Check for fields with flexible naming
         has_borrowed = 'currently_borrowed_books' in result or 'current_books' in result
@@ -305,12 +272,12 @@ class TestPatronStatusReport:
         assert isinstance(borrowed_books, list)
         assert isinstance(history, list)
 
-    def test_patron_status_no_borrowed_books(self):
+    def test_patron_status_no_borrowed_books(self, report_999999):
         """
         Test: Patron with no borrowed books
         Expected: Empty lists and zero values
         """
-        result = get_patron_status_report("999999")
+        result = report_999999
         
         borrowed_books = result.get('currently_borrowed_books', result.get('current_books', []))
         fees = result.get('total_late_fees_owed', result.get('total_fees', 0.0))
@@ -322,12 +289,12 @@ class TestPatronStatusReport:
         assert num_borrowed == 0
         assert len(history) == 0
 
-    def test_patron_status_overdue_books_identification(self):
+    def test_patron_status_overdue_books_identification(self, report_111111, now):
         """
         Test: Verify overdue books are properly identified
         Expected: Overdue status indicated in borrowed books
         """
-        result = get_patron_status_report("111111")
+        result = report_111111
         
         borrowed_books = result.get('currently_borrowed_books', result.get('current_books', []))
         
@@ -338,7 +305,7 @@ class TestPatronStatusReport:
             # Or check by due date
             try:
                 overdue_found = any(
-                    datetime.fromisoformat(book['due_date']) < datetime.now()
+                    datetime.fromisoformat(book['due_date']) < now
                     for book in borrowed_books if 'due_date' in book
                 )
                 assert has_overdue_info or overdue_found
@@ -346,12 +313,12 @@ class TestPatronStatusReport:
                 # May not have due_date field or different format
                 pass
 
-    def test_patron_status_data_types(self):
+    def test_patron_status_data_types(self, report_111111):
         """
         Test: Verify correct data types in response
         Expected: All fields have correct data types
         """
-        result = get_patron_status_report("111111")
+        result = report_111111
         
         # Check types with flexible field names
         if 'patron_id' in result:
@@ -369,30 +336,78 @@ class TestPatronStatusReport:
         history = result.get('borrowing_history', result.get('borrow_history', []))
         assert isinstance(history, list)
 
-    def test_patron_status_invalid_patron_format(self):
+
+@pytest.fixture(scope="module")
+def app():
+    """Flask app on the test database, built once for the route tests."""
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    """Fresh test client (and session cookie) per test."""
+    return app.test_client()
+
+
+class TestPatronStatusRoute:
+    """Test ETag revalidation of the patron status page"""
+
+    URL = '/patron/status?patron_id=222222'
+
+    def test_patron_status_unchanged_returns_304(self, client, insert_borrow, conn, now):
         """
-        Negative test: Invalid patron ID format
-        Expected: Error status with message
+        Test: Revalidating an unchanged status page
+        Expected: 304 with the same ETag
         """
-        result = get_patron_status_report("12345")  # Too short
-        
-        status = result.get('status', result.get('error', ''))
-        message = result.get('message', result.get('error', ''))
-        combined = (str(status) + ' ' + str(message)).lower()
-        
-        assert 'error' in combined or 'invalid' in combined
-        assert 'patron' in combined or 'invalid' in combined
+        insert_borrow("222222", 1, now + timedelta(days=14))
+        conn.commit()
+
+        first = client.get(self.URL)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+
+        second = client.get(self.URL, headers={'If-None-Match': etag})
+        assert second.status_code == 304
+        assert second.headers['ETag'] == etag
 
-    def test_patron_status_special_characters(self):
+    def test_patron_status_loan_turning_overdue_changes_etag(self, client, insert_borrow, conn, now):
         """
-        Negative test: Patron ID with special characters
-        Expected: Error status with message
+        Test: A loan passes its due time later the same day
+        Expected: Full page showing it overdue, not a 304
         """
-        result = get_patron_status_report("12@456")
-        
-        status = result.get('status', result.get('error', ''))
-        message = result.get('message', result.get('error', ''))
-        combined = (str(status) + ' ' + str(message)).lower()
-        
-        assert 'error' in combined or 'invalid' in combined
-        assert 'patron' in combined or 'invalid' in combined
\ No newline at end of file
+        insert_borrow("222222", 1, now + timedelta(hours=1))
+        conn.commit()
+        etag = client.get(self.URL).headers['ETag']
+
+        # Move the due time into the past, as the clock passing it would
+        conn.execute('UPDATE borrow_records SET due_date = ? WHERE patron_id = ?',
+                     ((now - timedelta(hours=1)).isoformat(), "222222"))
+        conn.commit()
+
+        response = client.get(self.URL, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        assert 'Overdue' in response.get_data(as_text=True)
+
+    def test_patron_status_pending_flash_skips_etag(self, client):
+        """
+        Test: Status page requested while a flash message is pending
+        Expected: Full page with the flash and no ETag, even if the client sends one
+        """
+        etag = client.get(self.URL).headers['ETag']
+        with client.session_transaction() as sess:
+            sess['_flashes'] = [('success', 'Pending flash message')]
+
+        response = client.get(self.URL, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
+        assert 'Pending flash message' in response.get_data(as_text=True)
+
+    def test_patron_status_non_ascii_digits_no_etag(self, client):
+        """
+        Test: Patron ID made of non-ASCII digits (Arabic-Indic)
+        Expected: Error page without an ETag
+        """
+        response = client.get('/patron/status', query_string={'patron_id': '\u0661' * 6})
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
@@ -1,31 +1,21 @@
 import pytest
-import sys
-sys.path.insert(0, '../')
 
-from database import init_database, get_db_connection
+import database
+
+from database import get_db_connection, get_patron_borrowed_books
 from datetime import datetime, timedelta
 
-from services.library_service import return_book_by_patron
+from services.library_service import return_book_by_patron, borrow_book_by_patron, get_book_by_id
 
 class TestReturnBookValidation:
     """Test patron ID and book ID validation requirements"""
     
     def setup_method(self):
         """Setup test environment before each test"""
-        init_database()
         # Borrow books for testing returns
-        from services.library_service import borrow_book_by_patron
         borrow_book_by_patron("123456", 1)  # Borrow book ID 1
         borrow_book_by_patron("654321", 2)  # Borrow book ID 2
     
-    def teardown_method(self):
-        """Cleanup after each test"""
-        try:
-            conn = get_db_connection()
-            conn.close()
-        except:
-            pass
-    
     def test_return_book_valid_patron_id_format(self):
         """
         Test: Valid 6-digit patron ID format
@@ -160,7 +150,6 @@ class TestReturnBookValidation:
         Positive test: Verify book availability is updated after return
         Expected: Success and available copies increased
         """
-        from services.library_service import get_book_by_id
         
         # Get initial availability
         initial_book = get_book_by_id(1)
@@ -192,7 +181,6 @@ class TestReturnBookValidation:
             WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
         ''', (past_due_date, "654321", 2))
         conn.commit()
-        conn.close()
 
         success, message = return_book_by_patron("654321", 2)
         
@@ -254,4 +242,90 @@ class TestReturnBookValidation:
         success, message = return_book_by_patron("123456", 1.5)
         
         assert success == False
-        assert "invalid" in message.lower() or "book not found" in message.lower() or "not found" in message.lower()
\ No newline at end of file
+        assert "invalid" in message.lower() or "book not found" in message.lower() or "not found" in message.lower()
+
+
+class TestReturnBookLoanCache:
+    """Test the cached active-loan list follows borrows and returns"""
+
+    def test_borrow_and_return_refresh_cached_loans(self):
+        """
+        Test: Read a patron's loans around a borrow and a return
+        Expected: Each read reflects the latest write, never a cached list
+        """
+        patron_id = "777777"
+        assert get_patron_borrowed_books(patron_id) == []  # caches the empty list
+
+        success, message = borrow_book_by_patron(patron_id, 1)
+        assert success == True
+        assert [loan['book_id'] for loan in get_patron_borrowed_books(patron_id)] == [1]
+
+        success, message = return_book_by_patron(patron_id, 1)
+        assert success == True
+        assert get_patron_borrowed_books(patron_id) == []
+
+    def test_borrow_during_read_is_not_cached(self, monkeypatch):
+        """
+        Test: A borrow commits after a loan read ran but before it was cached
+        Expected: The pre-borrow read is not cached, so the loan can be returned at once
+        """
+        patron_id = "777777"
+        fetch = database._fetch_patron_borrowed_books
+
+        def fetch_then_borrow(pid):
+            loans = fetch(pid)
+            monkeypatch.undo()
+            assert borrow_book_by_patron(patron_id, 1)[0] == True
+            return loans
+
+        monkeypatch.setattr(database, "_fetch_patron_borrowed_books", fetch_then_borrow)
+        assert get_patron_borrowed_books(patron_id) == []
+
+        success, message = return_book_by_patron(patron_id, 1)
+        assert success == True, message
+
+    def test_cached_loans_are_copies_with_current_overdue_flag(self, conn, insert_borrow, now, monkeypatch):
+        """
+        Test: Mutate a returned loan, then read again after its due time has passed
+        Expected: The cache is unaffected and is_overdue reflects the later time
+        """
+        patron_id = "777777"
+        insert_borrow(patron_id, 1, now + timedelta(hours=1))
+        conn.commit()
+
+        loans = get_patron_borrowed_books(patron_id)
+        assert loans[0]['is_overdue'] is False
+        loans[0]['title'] = 'Tampered'
+
+        class Later(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return now + timedelta(hours=2)
+
+        monkeypatch.setattr(database, "datetime", Later)
+        loans = get_patron_borrowed_books(patron_id)
+        assert loans[0]['title'] != 'Tampered'
+        assert loans[0]['is_overdue'] is True
+
+
+class TestReturnBookLateFeeMessage:
+    """Test the late fee reported when an overdue book is returned"""
+
+    @pytest.mark.parametrize("days_late,fee", [
+        (3, "$1.50"),    # $0.50/day for the first 7 days
+        (10, "$6.50"),   # 7 x $0.50 + 3 x $1.00
+        (40, "$15.00"),  # capped at $15
+    ])
+    def test_return_overdue_book_reports_tiered_fee(self, conn, insert_borrow, now, days_late, fee):
+        """
+        Test: Return a book the given number of days after its due date
+        Expected: Success message with the days late and the tiered late fee
+        """
+        insert_borrow("888888", 1, now - timedelta(days=days_late))
+        conn.commit()
+
+        success, message = return_book_by_patron("888888", 1)
+
+        assert success == True
+        assert f"{days_late} days late" in message
+        assert f"Late fee: {fee}" in message
@@ -1,9 +1,6 @@
-import pytest
-import sys
-sys.path.insert(0, '../')
+import time
 
-from database import init_database, get_db_connection
-init_database()
+import pytest
 
 from services.library_service import search_books_in_catalog
 
@@ -200,33 +197,23 @@ class TestSearchBooksByAuthor:
 class TestSearchBooksByISBN:
     """Test ISBN search functionality"""
     
-    def setup_method(self):
+    @pytest.fixture(autouse=True)
+    def setup_books(self, conn):
         """Setup test data for multiple results"""
-        init_database()  # Reset database to clean state
-        from database import get_db_connection
-        conn = get_db_connection()
+        # Use unique ISBNs that won't conflict
+        rows = [
+            ("The Book of Python", "John Smith", "5111111111111"),
+            ("Python Programming", "John Smith", "5222222222222"),
+            ("Learning Python", "Jane Smith", "5333333333333"),
+        ]
         try:
-            # Use unique ISBNs that won't conflict
-            conn.execute('''
-                INSERT OR IGNORE INTO books (title, author, isbn, total_copies, available_copies)
-                VALUES 
-                ("The Book of Python", "John Smith", "5111111111111", 1, 1),
-                ("Python Programming", "John Smith", "5222222222222", 1, 1),
-                ("Learning Python", "Jane Smith", "5333333333333", 1, 1)
-            ''')
-            conn.commit()
+            with conn:
+                conn.executemany('''
+                    INSERT OR IGNORE INTO books (title, author, isbn, total_copies, available_copies)
+                    VALUES (?, ?, ?, 1, 1)
+                ''', rows)
         except Exception as e:
             print(f"Setup warning: {e}")
-        finally:
-            conn.close()
-    
-    def teardown_method(self):
-        """Cleanup after each test"""
-        try:
-            conn = get_db_connection()
-            conn.close()
-        except:
-            pass
     
     def test_search_exact_isbn_gatsby(self):
         """
@@ -305,14 +292,12 @@ class TestSearchBooksByISBN:
         
         assert isinstance(result, list)
 
-    def test_search_with_unicode_characters(self):
+    def test_search_with_unicode_characters(self, conn):
         """
         Test: Search with Unicode characters
         Expected: Should handle Unicode characters appropriately
         """
         # Add a book with Unicode characters
-        from database import get_db_connection
-        conn = get_db_connection()
         try:
             conn.execute('''
                 INSERT OR IGNORE INTO books (title, author, isbn, total_copies, available_copies)
@@ -321,8 +306,6 @@ class TestSearchBooksByISBN:
             conn.commit()
         except Exception as e:
             print(f"Unicode insert warning: {e}")
-        finally:
-            conn.close()
 
         result = search_books_in_catalog("Código", "title")
         assert isinstance(result, list)
@@ -382,51 +365,36 @@ class TestSearchBooksEdgeCases:
 class TestSearchPerformance:
     """Test search functionality performance with large dataset"""
 
-    def setup_method(self):
+    @pytest.fixture(autouse=True)
+    def setup_books(self, conn):
         """Setup large dataset for performance testing"""
-        init_database()  # Reset to clean state
-        from database import get_db_connection
-        conn = get_db_connection()
+        # Add 100 sample books with unique ISBNs
+        # Use 6xxx format to avoid conflicts with other tests
+        rows = [
+            (f"Performance Test Book {i}", f"Test Author {i}", f"6{str(i).zfill(12)}")
+            for i in range(100)
+        ]
         try:
-            # Add 100 sample books with unique ISBNs
-            for i in range(100):
-                # Use 6xxx format to avoid conflicts with other tests
-                isbn = f"6{str(i).zfill(12)}"
-                conn.execute('''
+            # One transaction: committed on success, rolled back if any row fails
+            with conn:
+                conn.executemany('''
                     INSERT OR IGNORE INTO books (title, author, isbn, total_copies, available_copies)
                     VALUES (?, ?, ?, 1, 1)
-                ''', (
-                    f"Performance Test Book {i}",
-                    f"Test Author {i}",
-                    isbn
-                ))
-            conn.commit()
+                ''', rows)
         except Exception as e:
             print(f"Performance setup warning: {e}")
-        finally:
-            conn.close()
     
-    def teardown_method(self):
-        """Cleanup after test"""
-        try:
-            conn = get_db_connection()
-            conn.close()
-        except:
-            pass
-
-    def test_search_large_dataset(self):
+    def test_search_large_dataset(self, benchmark):
         """
         Test: Search performance with large dataset
         Expected: Should return results quickly and correctly
         """
-        import time
-        start_time = time.time()
-        
-        result = search_books_in_catalog("Performance Test", "title")
-        
-        end_time = time.time()
-        search_time = end_time - start_time
+        # pytest-benchmark handles warm-up and rounds, but turns itself off under xdist
+        # (the default run) and then just makes the call once, so time that call instead
+        start = time.perf_counter()
+        result = benchmark(search_books_in_catalog, "Performance Test", "title")
+        elapsed = time.perf_counter() - start if benchmark.disabled else benchmark.stats.stats.min
         
         # Should find many test books (may not be exactly 100 due to database state)
         assert len(result) >= 50  # Relaxed assertion
-        assert search_time < 2.0  # Should complete within 2 seconds (relaxed)
\ No newline at end of file
+        assert elapsed < 2.0  # Should complete within 2 seconds (relaxed)
\ No newline at end of file
@@ -1,20 +1,129 @@
+import os
+import threading
+import time
+import urllib.request
 import uuid
+from types import SimpleNamespace
+
+import pytest
 from playwright.sync_api import Page, expect
+from werkzeug.serving import make_server
+
+from app import create_app
+
+# Under pytest-xdist each worker gets its own patron IDs and ISBNs ("gw3" -> 3)
+WORKER_INDEX = int(os.environ.get("PYTEST_XDIST_WORKER", "gw0")[2:])
+
+# Set E2E_BASE_URL to run against an already running server instead of starting one;
+# otherwise live_server fills this in with the port the OS gave its server
+BASE_URL = os.environ.get("E2E_BASE_URL")
+
+# GET-only pages the flows visit; requesting each once up front compiles its template
+WARM_PATHS = ("/catalog", "/add_book", "/return", "/search", "/patron/status")
+
+
+def wait_until_ready(url: str, timeout: float = 10.0):
+    """Poll url until it answers, so tests never start against a server still booting."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def warm_pages():
+    """Fetch every page in WARM_PATHS once so the flows' first visits hit Jinja's template cache."""
+    for path in WARM_PATHS:
+        with urllib.request.urlopen(f"{BASE_URL}{path}", timeout=5):
+            pass
+
+
+@pytest.fixture(scope="module", autouse=True)
+def live_server():
+    """Serve the app on a free port for the duration of the module."""
+    global BASE_URL
+    if "E2E_BASE_URL" in os.environ:
+        wait_until_ready(f"{BASE_URL}/catalog")
+        warm_pages()
+        yield BASE_URL
+        return
+    # Port 0 lets the OS pick a free port, so a local `flask run` (or macOS AirPlay) on 5000 can't clash
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    warm_pages()
+    yield BASE_URL
+    server.shutdown()
+    thread.join()
+
+
+@pytest.fixture(scope="session")
+def browser_type_launch_args(browser_type_launch_args):
+    """Launch the session's single Chromium with the heavy extras turned off."""
+    return {
+        **browser_type_launch_args,
+        "args": ["--no-sandbox", "--disable-dev-shm-usage", "--disable-extensions", "--disable-gpu"],
+    }
+
+
+@pytest.fixture(scope="module")
+def context(browser, browser_context_args, live_server):
+    """One browser context for the whole module instead of one per test."""
+    # Every test uses UUID-named books, so sharing cookies and storage is harmless
+    ctx = browser.new_context(**{**browser_context_args, "base_url": live_server})
+    yield ctx
+    ctx.close()
+
+
+@pytest.fixture
+def page(context):
+    """Fresh tab per test in the shared context."""
+    page = context.new_page()
+    yield page
+    page.close()
+
+
+@pytest.fixture
+def seeded_book(context):
+    """
+    Add a book by posting the Add Book form directly, without driving the UI.
+    Function-scoped because the database is reset to the sample data after every test.
+    """
+    book = SimpleNamespace(title=f"E2E Seed Book {uuid.uuid4()}", author="Seed Author",
+                           isbn=make_isbn(), copies=2)
+    response = context.request.post(f"{BASE_URL}/add_book", form={
+        "title": book.title,
+        "author": book.author,
+        "isbn": book.isbn,
+        "total_copies": str(book.copies),
+    })
+    # A rejected form re-renders add_book.html with a 200, so check it redirected to the catalog
+    assert response.ok and response.url.endswith("/catalog"), f"seeding failed: {response.url}"
+    assert book.title in response.text()
+    return book
+
 
-BASE_URL = "http://127.0.0.1:5000"
+def worker_patron_id(base: int) -> str:
+    """Return a 6-digit patron ID unique to this worker (worker 0 gets base itself)."""
+    return f"{base + WORKER_INDEX:06d}"
 
 
 def make_isbn() -> str:
     """Return a random 13-digit ISBN string."""
-    # 978 prefix + 10 random digits
-    return "978" + str(uuid.uuid4().int)[:10]
+    # 978 prefix + worker digit + 9 random digits
+    return "978" + str(WORKER_INDEX % 10) + str(uuid.uuid4().int)[:9]
 
 
 def add_book_via_ui(page: Page, title: str, author: str, isbn: str, copies: int):
     """Helper that uses the real Add Book form."""
     # Go to home, then click "Add Book" in the nav bar
     page.goto(f"{BASE_URL}/")
-    page.locator("a:has-text('Add Book')").click()
+    page.get_by_role("link", name="Add Book").click()
 
     # Fill form (IDs from add_book.html)
     page.fill("input#title", title)
@@ -25,8 +134,7 @@ def add_book_via_ui(page: Page, title: str, author: str, isbn: str, copies: int)
     # Click the submit button (text from add_book.html)
     page.get_by_role("button", name="Add Book to Catalog").click()
 
-    # After success, route redirects to catalog page
-    page.wait_for_load_state("networkidle")
+    # After success, route redirects to catalog page (expect waits for it)
     expect(page.get_by_text("📖 Book Catalog")).to_be_visible()
 
 
@@ -45,32 +153,27 @@ def test_add_book_appears_in_catalog(page: Page):
 
     add_book_via_ui(page, title, author, isbn, copies)
 
-    # Assert: the new book is shown in the catalog table
-    row = page.locator("tbody tr", has_text=title).first
+    # Assert: the new book is shown in the catalog table, with its availability
+    # cell reading "Available"; all checks share one locator and one wait
+    row = (page.locator("tbody tr", has_text=title)
+           .filter(has_text=author).filter(has_text=isbn).filter(has_text="Available").first)
     expect(row).to_be_visible()
-    expect(row.get_by_text(author)).to_be_visible()
-    expect(row.get_by_text(isbn)).to_be_visible()
-    # Availability cell should contain "Available"
-    expect(row.get_by_text("Available")).to_be_visible()
 
 
-def test_borrow_book_and_patron_status(page: Page):
+def test_borrow_book_and_patron_status(page: Page, seeded_book):
     """
     Flow 2:
-      - Add a book
+      - Start from a freshly added book
       - Borrow it from the catalog using a 6-digit patron ID
       - Verify borrow success flash message
       - Navigate to Patron Status, search by same patron ID
       - Verify the borrowed book shows up in patron status tables
     """
-    title = f"E2E Borrow Book {uuid.uuid4()}"
-    author = "Borrow Author"
-    isbn = make_isbn()
-    copies = 2
-    patron_id = "123456"  # must be 6 digits, matches your validation
+    title = seeded_book.title
+    patron_id = worker_patron_id(123456)  # must be 6 digits, matches your validation
 
-    # 1) Add the book
-    add_book_via_ui(page, title, author, isbn, copies)
+    # 1) Open the catalog
+    page.goto(f"{BASE_URL}/catalog")
 
     # 2) Borrow from the catalog
     row = page.locator("tbody tr", has_text=title).first
@@ -82,45 +185,37 @@ def test_borrow_book_and_patron_status(page: Page):
     # Click the "Borrow" button in that row
     row.get_by_role("button", name="Borrow").click()
 
-    # Wait for any redirect / reload
-    page.wait_for_load_state("networkidle")
-
-    # 3) Assert a success flash message appears
+    # 3) Assert a success flash message appears (waits for the reload)
     success_flash = page.locator(".flash-success").first
     expect(success_flash).to_be_visible()
     expect(success_flash).to_contain_text("Successfully borrowed")
 
     # 4) Navigate to Patron Status via navbar
-    page.locator("a:has-text('Patron Status')").click()
+    page.get_by_role("link", name="Patron Status").click()
 
     # Fill Patron ID form on patron.html
     page.fill("input#patron_id", patron_id)
     page.get_by_role("button", name="View Status").click()
 
-    page.wait_for_load_state("networkidle")
-
     # 5) Assert the borrowed book shows up somewhere in the status tables
     borrowed_row = page.locator("tr", has_text=title).first
     expect(borrowed_row).to_be_visible()
 
 
-def test_return_book_flow(page: Page):
+def test_return_book_flow(page: Page, seeded_book):
     """
     Flow 3:
-      - Add a book
+      - Start from a freshly added book
       - Borrow it from the catalog
       - Go to Return Book page
       - Return using Patron ID + Book ID
       - Verify success flash message
     """
-    title = f"E2E Return Book {uuid.uuid4()}"
-    author = "Return Author"
-    isbn = make_isbn()
-    copies = 1
-    patron_id = "234567"
+    title = seeded_book.title
+    patron_id = worker_patron_id(234567)
 
-    # 1) Add the book
-    add_book_via_ui(page, title, author, isbn, copies)
+    # 1) Open the catalog
+    page.goto(f"{BASE_URL}/catalog")
 
     # 2) Borrow the book so it can be returned
     row = page.locator("tbody tr", has_text=title).first
@@ -133,22 +228,20 @@ def test_return_book_flow(page: Page):
     # Fill inline patron ID and borrow
     row.locator("input[name='patron_id']").fill(patron_id)
     row.get_by_role("button", name="Borrow").click()
-    page.wait_for_load_state("networkidle")
 
-    # Confirm borrow succeeded
+    # Confirm borrow succeeded (waits for the reload)
     success_flash = page.locator(".flash-success").first
     expect(success_flash).to_be_visible()
     expect(success_flash).to_contain_text("Successfully borrowed")
 
     # 3) Navigate to Return Book via navbar
-    page.locator("a:has-text('Return Book')").click()
+    page.get_by_role("link", name="Return Book").click()
 
     # 4) Fill return form (IDs from return_book.html)
     page.fill("input#patron_id", patron_id)
     page.fill("input#book_id", str(book_id))
 
     page.get_by_role("button", name="Process Return").click()
-    page.wait_for_load_state("networkidle")
 
     # 5) Assert success flash message about returning
     return_flash = page.locator(".flash-success").first
@@ -157,24 +250,23 @@ def test_return_book_flow(page: Page):
     expect(return_flash).to_contain_text("returned")
 
 
-def test_search_finds_added_book(page: Page):
+def test_search_finds_added_book(page: Page, seeded_book):
     """
     Flow 4:
-      - Add a book
+      - Start from a freshly added book
       - Go to Search page
       - Search by partial title using Title search
       - Verify it appears in the search results table
     """
-    full_title = f"E2E Search Book {uuid.uuid4()}"
-    author = "Search Author"
-    isbn = make_isbn()
-    copies = 4
+    full_title = seeded_book.title
+    author = seeded_book.author
+    isbn = seeded_book.isbn
 
-    # 1) Add the book
-    add_book_via_ui(page, full_title, author, isbn, copies)
+    # 1) Open the home page
+    page.goto(f"{BASE_URL}/")
 
     # 2) Navigate to Search via navbar
-    page.locator("a:has-text('Search')").click()
+    page.get_by_role("link", name="Search").click()
 
     # Use a partial title to test partial matching
     partial_title = full_title[:15]
@@ -188,10 +280,7 @@ def test_search_finds_added_book(page: Page):
     # The visual text is "🔍 Search", but accessible name should at least contain "Search"
     page.get_by_role("button", name="Search").click()
 
-    page.wait_for_load_state("networkidle")
-
-    # 3) Assert results table contains our book
-    row = page.locator("tbody tr", has_text=full_title).first
+    # 3) Assert results table contains our book (one locator, one wait)
+    row = (page.locator("tbody tr", has_text=full_title)
+           .filter(has_text=author).filter(has_text=isbn).first)
     expect(row).to_be_visible()
-    expect(row.get_by_text(author)).to_be_visible()
-    expect(row.get_by_text(isbn)).to_be_visible()
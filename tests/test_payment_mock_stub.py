@@ -2,178 +2,122 @@ import pytest
 from unittest.mock import Mock, patch
 from services.payment_service import PaymentGateway
 from datetime import datetime, timedelta
+from types import MappingProxyType
 
-
-from services.payment_service import PaymentGateway
 from services.library_service import pay_late_fees, refund_late_fee_payment
 from services import library_service
 
-# ---------------------------------------------------------------------
-# STUBBING AND MOCKING TESTS FOR pay_late_fees()
-# ---------------------------------------------------------------------
+# Read-only stub return values, built once at import
+BOOK_STUB = MappingProxyType({'id': 1, 'title': 'Test Book', 'author': 'Test Author', 'available_copies': 5})
+FEE_STUB_5 = MappingProxyType({'fee_amount': 5.00, 'days_overdue': 10, 'status': 'Late fee calculated'})
+FEE_STUB_ZERO_OVERDUE = MappingProxyType({'fee_amount': 0.00, 'days_overdue': 0, 'status': 'Book not overdue'})
+LAST_COPY_STUB = MappingProxyType({"id": 1, "title": "Test", "available_copies": 1})
+# Fixed clock for stubbed loans, so they never depend on when the suite runs
+_FIXED_NOW = datetime(2024, 1, 1, 12, 0, 0)
+BORROWED_STUB = (MappingProxyType({"book_id": 1, "due_date": _FIXED_NOW - timedelta(days=1)}),)
 
-@patch('services.library_service.calculate_late_fee_for_book')
-@patch('services.library_service.get_book_by_id')
-def test_pay_late_fees_success(mock_get_book, mock_calc_fee):
-    """Test successful payment with stubs for database functions"""
-    # Stub database functions
-    mock_get_book.return_value = {
-        'id': 1,
-        'title': 'Test Book',
-        'author': 'Test Author',
-        'available_copies': 5
-    }
-    mock_calc_fee.return_value = {
-        'fee_amount': 5.00,
-        'days_overdue': 10,
-        'status': 'Late fee calculated'
-    }
-    
-    # Mock payment gateway
-    mock_gateway = Mock(spec=PaymentGateway)
-    mock_gateway.process_payment.return_value = {
-        "success": True, 
-        "message": "Processed $5.00 for patron 123456."
-    }
-    
-    from services.library_service import pay_late_fees
-    
-    # Execute test with mocked gateway
-    result = pay_late_fees("123456", 1, mock_gateway)
-    
-    # Verify mock was called correctly
-    mock_gateway.process_payment.assert_called_once_with("123456", 5.00)
-    assert result["success"] is True
-    assert "5.00" in result["message"]
 
+class _StubMethod:
+    """Records calls and returns return_value, or raises side_effect (an exception) if set"""
 
-@patch('services.library_service.calculate_late_fee_for_book')
-@patch('services.library_service.get_book_by_id')
-def test_pay_late_fees_declined(mock_get_book, mock_calc_fee):
-    """Test payment declined by gateway"""
-    # Stub database functions
-    mock_get_book.return_value = {
-        'id': 1,
-        'title': 'Test Book',
-        'author': 'Test Author'
-    }
-    mock_calc_fee.return_value = {
-        'fee_amount': 5.00,
-        'days_overdue': 10,
-        'status': 'Late fee calculated'
-    }
-    
-    # Mock payment gateway with declined payment
-    mock_gateway = Mock(spec=PaymentGateway)
-    mock_gateway.process_payment.side_effect = ValueError("Payment declined")
-    
-    from services.library_service import pay_late_fees
-    
-    result = pay_late_fees("123456", 1, mock_gateway)
-    
-    mock_gateway.process_payment.assert_called_once_with("123456", 5.00)
-    assert result["success"] is False
-    assert "declined" in result["message"].lower()
+    def __init__(self):
+        self.calls = []
+        self.return_value = None
+        self.side_effect = None
 
+    def __call__(self, *args):
+        self.calls.append(args)
+        if self.side_effect is not None:
+            raise self.side_effect
+        return self.return_value
 
-@patch('services.library_service.calculate_late_fee_for_book')
-@patch('services.library_service.get_book_by_id')
-def test_pay_late_fees_invalid_patron_not_called(mock_get_book, mock_calc_fee):
-    """Test invalid patron ID - mock should NOT be called"""
-    # Stub database functions
-    mock_get_book.return_value = {
-        'id': 1,
-        'title': 'Test Book'
-    }
-    mock_calc_fee.return_value = {
-        'fee_amount': 0.00,
-        'days_overdue': 0,
-        'status': 'Invalid patron ID'
-    }
-    
-    # Mock payment gateway
-    mock_gateway = Mock(spec=PaymentGateway)
-    
-    from services.library_service import pay_late_fees
-    
-    result = pay_late_fees("INVALID", 1, mock_gateway)
-    
-    # Verify mock was NOT called due to invalid patron
-    mock_gateway.process_payment.assert_not_called()
-    assert result["success"] is False
+    def assert_called_once_with(self, *args):
+        assert self.calls == [args], f"expected one call with {args}, got {self.calls}"
 
+    def assert_not_called(self):
+        assert not self.calls, f"expected no calls, got {self.calls}"
 
-@patch('services.library_service.calculate_late_fee_for_book')
-@patch('services.library_service.get_book_by_id')
-def test_pay_late_fees_zero_fees_not_called(mock_get_book, mock_calc_fee):
-    """Test zero late fees - mock should NOT be called"""
-    # Stub database functions to return no overdue fees
-    mock_get_book.return_value = {
-        'id': 1,
-        'title': 'Test Book'
-    }
-    mock_calc_fee.return_value = {
-        'fee_amount': 0.00,
-        'days_overdue': 0,
-        'status': 'Book not overdue'
-    }
-    
-    # Mock payment gateway
-    mock_gateway = Mock(spec=PaymentGateway)
-    
-    from services.library_service import pay_late_fees
-    
-    result = pay_late_fees("123456", 1, mock_gateway)
-    
-    # Verify mock was NOT called when fees are zero
-    mock_gateway.process_payment.assert_not_called()
-    assert result["success"] is False
-    assert "no fees" in result["message"].lower() or "zero" in result["message"].lower() or "not overdue" in result["message"].lower()
+
+class _GatewayStub:
+    """Lightweight stand-in for PaymentGateway exposing only the methods the tests drive"""
+
+    def __init__(self):
+        self.process_payment = _StubMethod()
+        self.refund_payment = _StubMethod()
 
 
-@patch('services.library_service.calculate_late_fee_for_book')
-@patch('services.library_service.get_book_by_id')
-def test_pay_late_fees_network_error(mock_get_book, mock_calc_fee):
-    """Test network error exception handling"""
+@pytest.fixture
+def mock_gateway():
+    """Fresh PaymentGateway stub for each test"""
+    return _GatewayStub()
+
+
+@pytest.fixture(scope="module")
+def gateway():
+    """Real PaymentGateway shared by the direct tests; it holds no per-call state"""
+    return PaymentGateway()
+
+
+@pytest.fixture
+def lib_stubs(monkeypatch):
+    """Stub get_book_by_id and calculate_late_fee_for_book in library_service"""
+    mock_get_book = Mock()
+    mock_calc_fee = Mock()
+    monkeypatch.setattr(library_service, "get_book_by_id", mock_get_book)
+    monkeypatch.setattr(library_service, "calculate_late_fee_for_book", mock_calc_fee)
+    return mock_get_book, mock_calc_fee
+
+# ---------------------------------------------------------------------
+# STUBBING AND MOCKING TESTS FOR pay_late_fees()
+# ---------------------------------------------------------------------
+
+@pytest.mark.parametrize("fee,gateway_behavior,patron,expect_called,expect_success,msg_sub", [
+    (FEE_STUB_5, ("return", {"success": True, "message": "Processed $5.00 for patron 123456."}),
+     "123456", True, True, "5.00"),
+    (FEE_STUB_5, ("raise", ValueError("Payment declined")), "123456", True, False, "declined"),
+    (FEE_STUB_ZERO_OVERDUE, None, "INVALID", False, False, None),
+    (FEE_STUB_ZERO_OVERDUE, None, "123456", False, False, "not overdue"),
+    (FEE_STUB_5, ("raise", ConnectionError("Network failure")), "123456", True, False, "network"),
+], ids=["success", "declined", "invalid_patron_not_called", "zero_fees_not_called", "network_error"])
+def test_pay_late_fees(lib_stubs, mock_gateway, fee, gateway_behavior, patron,
+                       expect_called, expect_success, msg_sub):
+    """Test pay_late_fees with stubbed database functions and a mocked gateway"""
+    mock_get_book, mock_calc_fee = lib_stubs
     # Stub database functions
-    mock_get_book.return_value = {
-        'id': 1,
-        'title': 'Test Book'
-    }
-    mock_calc_fee.return_value = {
-        'fee_amount': 5.00,
-        'days_overdue': 10,
-        'status': 'Late fee calculated'
-    }
-    
-    # Mock payment gateway with network error
-    mock_gateway = Mock(spec=PaymentGateway)
-    mock_gateway.process_payment.side_effect = ConnectionError("Network failure")
-    
-    from services.library_service import pay_late_fees
-    
-    result = pay_late_fees("123456", 1, mock_gateway)
-    
-    mock_gateway.process_payment.assert_called_once_with("123456", 5.00)
-    assert result["success"] is False
-    assert "network" in result["message"].lower() or "connection" in result["message"].lower()
+    mock_get_book.return_value = BOOK_STUB
+    mock_calc_fee.return_value = fee
+
+    # Mock payment gateway: ("return", value) or ("raise", exception)
+    if gateway_behavior:
+        kind, value = gateway_behavior
+        if kind == "return":
+            mock_gateway.process_payment.return_value = value
+        else:
+            mock_gateway.process_payment.side_effect = value
+
+    result = pay_late_fees(patron, 1, mock_gateway)
+
+    if expect_called:
+        mock_gateway.process_payment.assert_called_once_with(patron, fee['fee_amount'])
+    else:
+        mock_gateway.process_payment.assert_not_called()
+    assert result["success"] is expect_success
+    if msg_sub:
+        assert msg_sub in result["message"].lower()
 
 
 # ---------------------------------------------------------------------
 # STUBBING AND MOCKING TESTS FOR refund_late_fee_payment()
 # ---------------------------------------------------------------------
 
-def test_refund_late_fee_success():
+def test_refund_late_fee_success(mock_gateway):
     """Test successful refund"""
     # Mock payment gateway
-    mock_gateway = Mock(spec=PaymentGateway)
     mock_gateway.refund_payment.return_value = {
         "success": True,
         "message": "Refunded $5.00 to patron 123456."
     }
     
-    from services.library_service import refund_late_fee_payment
-    
     result = refund_late_fee_payment("TXN123456", 5.00, mock_gateway)
     
     mock_gateway.refund_payment.assert_called_once_with("TXN123456", 5.00)
@@ -181,101 +125,51 @@ def test_refund_late_fee_success():
     assert "refunded" in result["message"].lower()
 
 
-def test_refund_late_fee_invalid_transaction():
-    """Test invalid transaction ID rejection"""
-    # Mock payment gateway with invalid transaction
-    mock_gateway = Mock(spec=PaymentGateway)
-    mock_gateway.refund_payment.side_effect = ValueError("Invalid transaction ID")
-    
-    from services.library_service import refund_late_fee_payment
-    
-    result = refund_late_fee_payment("INVALID", 5.00, mock_gateway)
-    
-    mock_gateway.refund_payment.assert_called_once_with("INVALID", 5.00)
-    assert result["success"] is False
-    assert "invalid" in result["message"].lower()
-
-
-def test_refund_late_fee_negative_amount():
-    """Test negative refund amount rejection"""
-    # Mock payment gateway with negative amount error
-    mock_gateway = Mock(spec=PaymentGateway)
-    mock_gateway.refund_payment.side_effect = ValueError("Invalid refund amount.")
-    
-    from services.library_service import refund_late_fee_payment
-    
-    result = refund_late_fee_payment("TXN123456", -5.00, mock_gateway)
-    
-    mock_gateway.refund_payment.assert_called_once_with("TXN123456", -5.00)
-    assert result["success"] is False
-    assert "invalid" in result["message"].lower()
-
-
-def test_refund_late_fee_zero_amount():
-    """Test zero refund amount rejection"""
-    # Mock payment gateway with zero amount error
-    mock_gateway = Mock(spec=PaymentGateway)
-    mock_gateway.refund_payment.side_effect = ValueError("Invalid refund amount.")
-    
-    from services.library_service import refund_late_fee_payment
-    
-    result = refund_late_fee_payment("TXN123456", 0.00, mock_gateway)
-    
-    mock_gateway.refund_payment.assert_called_once_with("TXN123456", 0.00)
-    assert result["success"] is False
+@pytest.mark.parametrize("txn,amount,err,msg_fragment", [
+    ("INVALID", 5.00, "Invalid transaction ID", "invalid"),
+    ("TXN123456", -5.00, "Invalid refund amount.", "invalid"),
+    ("TXN123456", 0.00, "Invalid refund amount.", None),
+    ("TXN123456", 20.00, "Refund exceeds $15 limit.", "exceeds"),
+], ids=["invalid_transaction", "negative_amount", "zero_amount", "exceeds_limit"])
+def test_refund_failure(mock_gateway, txn, amount, err, msg_fragment):
+    """Test gateway refund errors are reported as failures"""
+    mock_gateway.refund_payment.side_effect = ValueError(err)
 
+    result = refund_late_fee_payment(txn, amount, mock_gateway)
 
-def test_refund_late_fee_exceeds_limit():
-    """Test refund amount exceeding $15 maximum"""
-    # Mock payment gateway with limit exceeded error
-    mock_gateway = Mock(spec=PaymentGateway)
-    mock_gateway.refund_payment.side_effect = ValueError("Refund exceeds $15 limit.")
-    
-    from services.library_service import refund_late_fee_payment
-    
-    result = refund_late_fee_payment("TXN123456", 20.00, mock_gateway)
-    
-    mock_gateway.refund_payment.assert_called_once_with("TXN123456", 20.00)
+    mock_gateway.refund_payment.assert_called_once_with(txn, amount)
     assert result["success"] is False
-    assert "exceeds" in result["message"].lower() or "limit" in result["message"].lower()
-
-
-
+    if msg_fragment:
+        assert msg_fragment in result["message"].lower()
 
 
 # ---------------------------------------------------------------------
 # DIRECT TESTS FOR PaymentGateway (to raise coverage)
 # ---------------------------------------------------------------------
 
-def test_process_payment_success():
-    gateway = PaymentGateway()
+def test_process_payment_success(gateway):
     result = gateway.process_payment("123456", 10.0)
     assert result["success"] is True
     assert "Processed" in result["message"]
 
-def test_process_payment_invalid_amount():
-    gateway = PaymentGateway()
+def test_process_payment_invalid_amount(gateway):
     with pytest.raises(ValueError, match="Invalid payment amount"):
         gateway.process_payment("123456", 0)
 
-def test_process_payment_invalid_patron_id():
-    gateway = PaymentGateway()
+def test_process_payment_invalid_patron_id(gateway):
     with pytest.raises(ValueError, match="Invalid patron ID"):
         gateway.process_payment("ABCDEF", 10.0)
 
-def test_refund_payment_success():
-    gateway = PaymentGateway()
+def test_refund_payment_success(gateway):
     result = gateway.refund_payment("123456", 5.0)
     assert result["success"] is True
     assert "Refunded" in result["message"]
 
-def test_refund_payment_invalid_amount():
-    gateway = PaymentGateway()
+def test_refund_payment_invalid_amount(gateway):
     with pytest.raises(ValueError, match="Invalid refund amount"):
         gateway.refund_payment("123456", -1.0)
 
-def test_refund_payment_invalid_patron_id():
-    gateway = PaymentGateway()
+def test_refund_payment_invalid_patron_id(gateway):
     with pytest.raises(ValueError, match="Invalid patron ID"):
         gateway.refund_payment("ABCDEF", 5.0)
 
@@ -287,34 +181,69 @@ def test_refund_payment_invalid_patron_id():
 # over the 80% coverage requirement, without touching production code.
 # ---------------------------------------------------------------------
 
+class BadConn:
+    """Connection stand-in whose every query fails."""
+
+    def execute(self, *args, **kwargs):
+        raise Exception("DB failure")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def bad_conn(monkeypatch):
+    """Make library_service's get_db_connection hand out a failing connection"""
+    monkeypatch.setattr(library_service, "get_db_connection", lambda: BadConn())
+
+
 def test_borrow_book_db_error_on_insert():
     """borrow_book_by_patron: branch where insert_borrow_record fails."""
     with patch("services.library_service.get_book_by_id",
-               return_value={"id": 1, "title": "Test", "available_copies": 1}), \
+               return_value=LAST_COPY_STUB), \
          patch("services.library_service.get_patron_borrow_count",
                return_value=0), \
+         patch("services.library_service.checkout_book_copy",
+               return_value=True), \
          patch("services.library_service.insert_borrow_record",
-               return_value=False):
+               return_value=False), \
+         patch("services.library_service.update_book_availability") as mock_update:
         success, msg = library_service.borrow_book_by_patron("123456", 1)
 
     assert success is False
     assert "creating borrow record" in msg.lower()
+    # The copy taken for the failed loan is put back
+    mock_update.assert_called_once_with(1, 1)
+
+
+def test_borrow_book_at_limit_rejected():
+    """borrow_book_by_patron: patron already holding 5 books cannot borrow a 6th."""
+    with patch("services.library_service.get_book_by_id",
+               return_value=LAST_COPY_STUB), \
+         patch("services.library_service.get_patron_borrow_count",
+               return_value=5), \
+         patch("services.library_service.insert_borrow_record") as mock_insert:
+        success, msg = library_service.borrow_book_by_patron("123456", 1)
+
+    assert success is False
+    assert "maximum borrowing limit" in msg.lower()
+    mock_insert.assert_not_called()
 
 
-def test_borrow_book_db_error_on_availability_update():
-    """borrow_book_by_patron: branch where update_book_availability fails."""
+def test_borrow_book_last_copy_taken_concurrently():
+    """borrow_book_by_patron: branch where checkout_book_copy finds no copy left."""
     with patch("services.library_service.get_book_by_id",
-               return_value={"id": 1, "title": "Test", "available_copies": 1}), \
+               return_value=LAST_COPY_STUB), \
          patch("services.library_service.get_patron_borrow_count",
                return_value=0), \
-         patch("services.library_service.insert_borrow_record",
-               return_value=True), \
-         patch("services.library_service.update_book_availability",
-               return_value=False):
+         patch("services.library_service.checkout_book_copy",
+               return_value=False), \
+         patch("services.library_service.insert_borrow_record") as mock_insert:
         success, msg = library_service.borrow_book_by_patron("123456", 1)
 
     assert success is False
-    assert "updating book availability" in msg.lower()
+    assert "not available" in msg.lower()
+    mock_insert.assert_not_called()
 
 
 def test_return_book_not_borrowed_by_patron():
@@ -331,14 +260,10 @@ def test_return_book_not_borrowed_by_patron():
 
 def test_return_book_db_error_on_update_record():
     """return_book_by_patron: branch where update_borrow_record_return_date fails."""
-    borrowed = [{
-        "book_id": 1,
-        "due_date": datetime.now() - timedelta(days=1),
-    }]
     with patch("services.library_service.get_book_by_id",
                return_value={"id": 1, "title": "Test"}), \
          patch("services.library_service.get_patron_borrowed_books",
-               return_value=borrowed), \
+               return_value=BORROWED_STUB), \
          patch("services.library_service.update_borrow_record_return_date",
                return_value=False):
         success, msg = library_service.return_book_by_patron("123456", 1)
@@ -349,14 +274,10 @@ def test_return_book_db_error_on_update_record():
 
 def test_return_book_db_error_on_availability_update():
     """return_book_by_patron: branch where update_book_availability fails on return."""
-    borrowed = [{
-        "book_id": 1,
-        "due_date": datetime.now(),
-    }]
     with patch("services.library_service.get_book_by_id",
                return_value={"id": 1, "title": "Test"}), \
          patch("services.library_service.get_patron_borrowed_books",
-               return_value=borrowed), \
+               return_value=BORROWED_STUB), \
          patch("services.library_service.update_borrow_record_return_date",
                return_value=True), \
          patch("services.library_service.update_book_availability",
@@ -379,36 +300,16 @@ def test_calculate_late_fee_book_not_borrowed():
     assert result["status"] == "Book not borrowed by this patron"
 
 
-def test_search_books_handles_exception():
+def test_search_books_handles_exception(bad_conn):
     """search_books_in_catalog: exercise except-block returning [] on DB error."""
-
-    class BadConn:
-        def execute(self, *args, **kwargs):
-            raise Exception("DB failure")
-
-        def close(self):
-            pass
-
-    with patch("services.library_service.get_db_connection", return_value=BadConn()):
-        results = library_service.search_books_in_catalog("anything", "title")
+    results = library_service.search_books_in_catalog("anything", "title")
 
     assert results == []
 
 
-def test_get_patron_status_report_db_error():
+def test_get_patron_status_report_db_error(bad_conn):
     """get_patron_status_report: exercise exception path -> error dict."""
-
-    class BadConn:
-        def execute(self, *args, **kwargs):
-            raise Exception("DB failure")
-
-        def close(self):
-            pass
-
-    with patch("services.library_service.get_db_connection", return_value=BadConn()), \
-         patch("services.library_service.get_patron_borrowed_books",
-               return_value=[]):
-        report = library_service.get_patron_status_report("123456")
+    report = library_service.get_patron_status_report("123456")
 
     assert report["error"].startswith("Database error occurred while generating report.")
     assert report["current_books"] == []
\ No newline at end of file